@@ -0,0 +1,311 @@
+""" Local stand-ins for the Meetup, Trello and Slack APIs, serving payloads shaped like the real ones
+at whatever size a benchmark asks for. They run in their own process, so they don't show up in our measurements.
+"""
+import json
+import multiprocessing as mp
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Lock
+from urllib.parse import parse_qs, urlencode, urlsplit
+from urllib.request import Request, urlopen
+
+DAY = 24 * 3600 * 1000
+NOW = 1527000000000
+ACTIVITY = datetime(2018, 5, 23)
+TEAM = "storg"
+CHANNELS = {"C0SOUTH": "storg-south", "C0NORTH": "storg-north", "CLAB": "lab"}
+VENUES = ["STORG Clubhouse", "STORG Northern Clubhouse"]
+TRELLO_ID = re.compile(r"/[0-9a-f]{24}(?=/|$)")
+
+
+class World(object):
+    def __init__(self, events: int = 3, rsvps: int = 100, tables: int = 10, on_board: float = 0.8) -> None:
+        """The upcoming events of a Meetup group, their RSVPs and their Trello boards
+
+        :param events: (int) Number of upcoming events
+        :param rsvps: (int) RSVPs per event
+        :param tables: (int) Game tables per event board
+        :param on_board: (float) Fraction of the members who said yes that already have a card on the board
+        """
+        self._next_id = 0
+        self._next_member = 1000
+        self._lock = Lock()
+        self.calls = Counter()
+        self.org = {"id": self.new_id(), "name": TEAM, "displayName": "STORG", "url": "https://trello.com/storg"}
+        self.events = []
+        self.rsvps = {}
+        self.boards = {}
+        self.cards = {}
+        for number in range(events):
+            self._add_event(number, rsvps, tables, on_board)
+
+    def new_id(self) -> str:
+        self._next_id += 1
+        return "{:024x}".format(self._next_id)
+
+    def _rsvp(self, response: str, mtime: int) -> dict:
+        self._next_member += 1
+        return {"member": {"member_id": self._next_member, "name": "Member {}".format(self._next_member)},
+                "response": response, "mtime": mtime}
+
+    def _add_event(self, number: int, rsvps: int, tables: int, on_board: float) -> None:
+        venue = VENUES[number % len(VENUES)]
+        event = {"id": str(249792000 + number), "name": "Event {}".format(number), "time": NOW + (number + 1) * DAY,
+                 "status": "upcoming", "rsvp_limit": rsvps, "announced": True, "updated": NOW,
+                 "event_url": "https://www.meetup.com/Stockholm-Roleplaying-Guild/events/{}/".format(
+                     249792000 + number),
+                 "venue": {"name": venue}}
+        # Mostly yes, with some cancellations and a waitlist, modified over the last week
+        responses = ["no" if i % 20 == 0 else "waitlist" if i % 20 == 1 else "yes" for i in range(rsvps)]
+        self.rsvps[event["id"]] = [self._rsvp(response, NOW - 7 * DAY + i * 1000)
+                                   for i, response in enumerate(responses)]
+        self._count(event)
+        self.events.append(event)
+
+        board_id = self.new_id()
+        board = {"id": board_id, "name": event["name"], "url": "https://trello.com/b/{}".format(board_id),
+                 "closed": False, "idOrganization": self.org["id"], "dateLastActivity": "2018-05-22T10:00:00.000Z",
+                 "lists": [], "cards": [], "labels": []}
+        self.boards[board_id] = board
+        gm = self._add_label(board, "GM", "green")
+        canceled = self._add_label(board, "Canceled", "red")
+        rsvp_list = self._add_list(board, "RSVP", 0)
+        table_lists = [self._add_list(board, "{}. Table {} (System {})".format(n, n, n), n)
+                       for n in range(1, tables + 1)]
+        for n, table_list in enumerate(table_lists, 1):
+            self._add_card(table_list["id"], "Info", "A one-shot for table {}. Players: 5".format(n))
+            self._add_card(table_list["id"], "Game Master {}".format(n), "", labels=[gm])
+
+        members = [r for r in self.rsvps[event["id"]] if r["response"] in ("yes", "no")]
+        for i, rsvp in enumerate(members[:int(len(members) * on_board)]):
+            # Some yes members already sit at a table, and some who said no still have a card
+            table_list = table_lists[i % len(table_lists)] if table_lists and i % 2 else rsvp_list
+            labels = [canceled] if rsvp["response"] == "no" and i % 3 == 0 else []
+            self._add_card(table_list["id"], rsvp["member"]["name"], str(rsvp["member"]["member_id"]), labels=labels)
+
+    def _count(self, event: dict) -> None:
+        responses = Counter(r["response"] for r in self.rsvps[event["id"]])
+        event["yes_rsvp_count"] = responses["yes"]
+        event["waitlist_count"] = responses["waitlist"]
+
+    def _add_label(self, board: dict, name: str, color: str) -> dict:
+        label = {"id": self.new_id(), "name": name, "color": color}
+        board["labels"].append(label)
+        return label
+
+    def _add_list(self, board: dict, name: str, pos: float) -> dict:
+        board_list = {"id": self.new_id(), "name": name, "pos": pos, "closed": False, "idBoard": board["id"]}
+        board["lists"].append(board_list)
+        return board_list
+
+    def _board_of_list(self, list_id: str) -> dict:
+        for board in self.boards.values():
+            if any(l["id"] == list_id for l in board["lists"]):
+                return board
+        raise KeyError(list_id)
+
+    def _add_card(self, list_id: str, name: str, desc: str, labels: list = None) -> dict:
+        board = self._board_of_list(list_id)
+        card = {"id": self.new_id(), "name": name, "desc": desc or "", "idList": list_id, "idBoard": board["id"],
+                "labels": list(labels or []), "pos": len(board["cards"]), "closed": False}
+        board["cards"].append(card)
+        self.cards[card["id"]] = card
+        self._touch(board)
+        return card
+
+    def _touch(self, board: dict) -> None:
+        self._next_id += 1
+        board["dateLastActivity"] = (ACTIVITY + timedelta(milliseconds=self._next_id)).strftime(
+            "%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+    def churn(self, event_number: int, count: int) -> None:
+        """Makes :count: new members say yes to an event and :count: members who said yes change their mind"""
+        with self._lock:
+            event = self.events[event_number]
+            rsvps = self.rsvps[event["id"]]
+            latest = max(r["mtime"] for r in rsvps)
+            for rsvp in [r for r in rsvps if r["response"] == "yes"][:count]:
+                latest += 1000
+                rsvp.update(response="no", mtime=latest)
+            for _ in range(count):
+                latest += 1000
+                rsvps.append(self._rsvp("yes", latest))
+            self._count(event)
+            event["updated"] = latest
+
+    def handle(self, method: str, url: str, body: bytes) -> (int, dict, object):
+        """Answers one API call
+
+        :return: (tuple) The HTTP status, extra headers and the JSON to answer with
+        """
+        parts = urlsplit(url)
+        service, _, path = parts.path.lstrip("/").partition("/")
+        path = "/" + path
+        query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        with self._lock:
+            self.calls["{} {} {}".format(service, method, TRELLO_ID.sub("/{id}", path))] += 1
+            if service == "meetup":
+                return self._meetup(path, query)
+            if service == "trello":
+                return self._trello(method, path, query, json.loads(body.decode()) if body else {})
+            if service == "slack":
+                return self._slack(path, {k: v[-1] for k, v in parse_qs(body.decode()).items()})
+        return 404, {}, {}
+
+    def _meetup(self, path: str, query: dict) -> (int, dict, object):
+        if path == "/2/events":
+            return 200, {}, {"results": self.events, "meta": {"next": "", "total_count": len(self.events)}}
+        if path == "/2/rsvps":
+            rsvps = self.rsvps.get(query.get("event_id"), [])
+            page, offset = int(query.get("page", 200)), int(query.get("offset", 0))
+            results = rsvps[page * offset:page * (offset + 1)]
+            next_url = ""
+            if page * (offset + 1) < len(rsvps):
+                next_url = "https://api.meetup.com/2/rsvps?" + urlencode(dict(query, offset=offset + 1))
+            only = query.get("only")
+            if only:
+                results = [{k: v for k, v in r.items() if k in only.split(",")} for r in results]
+            return 200, {}, {"results": results, "meta": {"next": next_url, "total_count": len(rsvps)}}
+        return 404, {}, {"problem": "Not found"}
+
+    def _trello(self, method: str, path: str, query: dict, body: dict) -> (int, dict, object):
+        parts = path.strip("/").split("/")[1:]
+        if method == "GET" and parts == ["members", "me", "organizations"]:
+            return 200, {}, [self.org]
+        if method == "GET" and len(parts) == 3 and parts[0] == "organizations" and parts[2] == "actions":
+            if "since" in query:
+                return 200, {}, []
+            return 200, {}, [{"id": self.new_id(), "date": "2018-05-22T10:00:00.000Z"}]
+        if method == "GET" and len(parts) == 3 and parts[0] == "organizations" and parts[2] == "boards":
+            return 200, {}, [{k: b[k] for k in ("id", "name", "url", "closed", "idOrganization")}
+                             for b in self.boards.values()]
+        if method == "GET" and len(parts) == 2 and parts[0] == "boards" and parts[1] in self.boards:
+            board = self.boards[parts[1]]
+            fields = query.get("fields", "").split(",")
+            answer = {"id": board["id"]}
+            answer.update({f: board[f] for f in fields if f in board})
+            if "lists" in query:
+                answer.update(lists=board["lists"], cards=board["cards"], labels=board["labels"])
+            return 200, {}, answer
+        if method == "GET" and len(parts) == 2 and parts[0] == "cards" and parts[1] in self.cards:
+            return 200, {}, self.cards[parts[1]]
+        if method == "POST" and parts == ["cards"]:
+            return 200, {}, self._add_card(body["idList"], body.get("name"), body.get("desc"))
+        if method == "POST" and len(parts) == 3 and parts[0] == "cards" and parts[2] == "idLabels":
+            card = self.cards[parts[1]]
+            board = self.boards[card["idBoard"]]
+            card["labels"].extend(l for l in board["labels"] if l["id"] == body["value"])
+            self._touch(board)
+            return 200, {}, [l["id"] for l in card["labels"]]
+        if method == "POST" and parts == ["lists"]:
+            board = self.boards[body["idBoard"]]
+            return 200, {}, self._add_list(board, body["name"], len(board["lists"]))
+        return 404, {}, {"message": "not found"}
+
+    def _slack(self, path: str, args: dict) -> (int, dict, object):
+        method = path.rsplit("/", 1)[-1]
+        channels = [{"id": channel_id, "name": name, "is_channel": True, "is_member": True,
+                     "topic": {"value": "<{}>".format(self._board_url(name))}}
+                    for channel_id, name in CHANNELS.items()]
+        if method == "rtm.start":
+            return 200, {}, {"ok": True, "self": {"id": "UBOT", "name": "dave"}, "team": {"id": "T1"},
+                             "channels": channels, "ims": [], "users": [], "url": "ws://127.0.0.1:1/"}
+        if method == "channels.info":
+            channel = [c for c in channels if c["id"] == args.get("channel")]
+            if not channel:
+                return 200, {}, {"ok": False, "error": "channel_not_found"}
+            return 200, {}, {"ok": True, "channel": channel[0]}
+        if method == "chat.postMessage":
+            return 200, {}, {"ok": True, "channel": args.get("channel"), "ts": "1527000000.000100"}
+        if method == "im.list":
+            return 200, {}, {"ok": True, "ims": []}
+        if method == "users.info":
+            return 200, {}, {"ok": True, "user": {"id": args.get("user"), "name": "someone"}}
+        return 200, {}, {"ok": False, "error": "unknown_method"}
+
+    def _board_url(self, channel_name: str) -> str:
+        venue = {"storg-south": VENUES[0], "storg-north": VENUES[1]}.get(channel_name)
+        for event in self.events:
+            if event["venue"]["name"] == venue:
+                return [b for b in self.boards.values() if b["name"] == event["name"]][0]["url"]
+        return ""
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _answer(self, status: int, headers: dict, payload: object) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method: str) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        world = self.server.world
+        if self.path == "/_calls":
+            with world._lock:
+                calls = dict(world.calls)
+                if method == "POST":
+                    world.calls.clear()
+            return self._answer(200, {}, calls)
+        if self.path.startswith("/_churn"):
+            query = parse_qs(urlsplit(self.path).query)
+            world.churn(int(query["event"][0]), int(query["count"][0]))
+            return self._answer(200, {}, {})
+        self._answer(*world.handle(method, self.path, body))
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve(sizes: dict, ports: mp.Queue) -> None:
+    server = _Server(("127.0.0.1", 0), _Handler)
+    server.world = World(**sizes)
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+class FakeServices(object):
+    def __init__(self, **sizes) -> None:
+        """Starts the fake APIs in a child process
+
+        :param sizes: The arguments of World
+        """
+        ports = mp.Queue()
+        self._process = mp.Process(target=_serve, args=(sizes, ports), daemon=True)
+        self._process.start()
+        self.url = "http://127.0.0.1:{}".format(ports.get(timeout=30))
+
+    def _call(self, path: str, method: str = "GET") -> dict:
+        request = Request(self.url + path, data=b"" if method == "POST" else None, method=method)
+        with urlopen(request, timeout=10) as response:
+            return json.loads(response.read().decode())
+
+    def calls(self, reset: bool = True) -> dict:
+        """The API calls made so far, by service, method and path"""
+        return self._call("/_calls", "POST" if reset else "GET")
+
+    def churn(self, event_number: int, count: int) -> None:
+        self._call("/_churn?event={}&count={}".format(event_number, count))
+
+    def stop(self) -> None:
+        self._process.terminate()
+        self._process.join()
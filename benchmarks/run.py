@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+""" Benchmarks the bot against local fake APIs, without network.
+
+Run from the repository root:
+
+    python -m benchmarks.run                     # measure and compare with benchmarks/baseline.json
+    python -m benchmarks.run --save              # measure and make the results the new baseline
+    python -m benchmarks.run --rsvps 10 500 --tables 5 40
+    python -m benchmarks.run --strict            # also fail on time and memory, against a baseline from this machine
+
+API call counts don't depend on the machine and must never go up, so more calls than the baseline fail the run.
+Wall time and peak memory depend on the machine and its load, so they are only reported.
+Wall time is measured with tracemalloc on, so it's only comparable with other runs of this harness.
+"""
+import argparse
+import gc
+import json
+import sys
+import tempfile
+import tracemalloc
+from contextlib import contextmanager
+from itertools import product
+from os import environ, path
+from queue import Queue
+from time import perf_counter
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+
+from benchmarks.fakes import CHANNELS, FakeServices
+
+BASELINE = path.join(path.dirname(__file__), "baseline.json")
+HOSTS = {"api.meetup.com": "meetup", "api.trello.com": "trello", "slack.com": "slack"}
+COMMANDS = ["help", "table status", "available tables", "detailed table status", "table 1", "next event", "events",
+            "thanks", "what can you do", "admin info", "add table",
+            "add table Rat Queens (Fate): One more awesome Rat Queens adventure, Players: 5", "hello"]
+
+
+@contextmanager
+def offline(base_url):
+    """Sends every request for Meetup, Trello and Slack to the fake APIs at :base_url: instead"""
+    send = HTTPAdapter.send
+
+    def redirected(adapter, request, **kwargs):
+        parts = urlsplit(request.url)
+        service = HOSTS.get(parts.netloc)
+        if service:
+            request.url = "{}/{}{}{}".format(base_url, service, parts.path, "?" + parts.query if parts.query else "")
+        return send(adapter, request, **kwargs)
+
+    HTTPAdapter.send = redirected
+    try:
+        yield
+    finally:
+        HTTPAdapter.send = send
+
+
+def measure(fakes, action):
+    """Runs :action: once
+
+    :return: (dict) Its wall time, peak memory allocated by Python and API calls
+    """
+    fakes.calls()
+    gc.collect()
+    tracemalloc.start()
+    started = perf_counter()
+    action()
+    wall = perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    calls = fakes.calls()
+    return {"wall_seconds": round(wall, 4), "peak_kib": round(peak / 1024, 1), "calls": sum(calls.values()),
+            "api_calls": calls}
+
+
+def make_bot(fakes, db_path):
+    environ.update({"SLACK_API_TOKEN": "xoxb-benchmark", "BOT_ID": "UBOT", "LAB_CHANNEL_ID": "CLAB",
+                    "TRELLO_API_KEY": "key", "TRELLO_TOKEN": "token", "TRELLO_TEAM": "storg",
+                    "MEETUP_API_KEY": "key", "MEETUP_GROUP_ID": "1", "DATABASE_URL": "sqlite:///" + db_path,
+                    # Measure our code, not the pacing meant for the real APIs
+                    "TRELLO_TOKEN_RATE": "100000", "TRELLO_KEY_RATE": "100000"})
+    from dave.bot import Bot
+    bot = Bot()
+    bot.chat.channels.prime(bot.chat.sc.api_call("rtm.start")["channels"])
+    return bot
+
+
+def rtm_message(text, channel="C0SOUTH"):
+    return {"type": "message", "channel": channel, "user": "U0PLAYER", "text": "<@UBOT> " + text,
+            "ts": "1527000000.000200"}
+
+
+def run_size(events, rsvps, tables):
+    """Runs every scenario against a world of the given size
+
+    :return: (dict) The measurements by scenario
+    """
+    from dave.scheduler import SyncScheduler
+
+    fakes = FakeServices(events=events, rsvps=rsvps, tables=tables)
+    results = {}
+    try:
+        with offline(fakes.url), tempfile.TemporaryDirectory() as tmp:
+            bot = make_bot(fakes, path.join(tmp, "dave.sqlite3"))
+
+            def check_events():
+                bot.check_events()
+                bot.announcer.flush()
+
+            results["check_events"] = measure(fakes, check_events)
+
+            # Nothing changed, but every event is due again
+            bot.scheduler = SyncScheduler()
+            results["check_events_unchanged"] = measure(fakes, check_events)
+
+            fakes.churn(0, max(1, rsvps // 10))
+            bot.storg.invalidate_events()
+            event = bot.storg.upcoming_events[0]
+
+            def handle_rsvps():
+                bot._handle_rsvps(event)
+                bot.announcer.flush()
+
+            results["_handle_rsvps"] = measure(fakes, handle_rsvps)
+
+            board_id, _ = bot.trello.board_version(event.name)
+            bot.trello.invalidate(board_id)
+            results["tables_for_event"] = measure(fakes, lambda: bot.trello.tables_for_event(event.name))
+            results["tables_for_event_cached"] = measure(fakes, lambda: bot.trello.tables_for_event(event.name))
+
+            channel = [c for c, name in CHANNELS.items() if name == "storg-south"][0]
+            for command in COMMANDS:
+                tasks = Queue()
+                bot.chat._dispatch([rtm_message(command, channel)], tasks)
+                task = tasks.get_nowait()
+                name = bot.commands.match(task[0])[0] or "chatter"
+                key = "conversation:{}".format(name)
+                if key in results:
+                    key = "conversation:{}:{}".format(name, command.split(":")[0])
+                results[key] = measure(fakes, lambda: bot.answer(task))
+    finally:
+        fakes.stop()
+    return results
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance):
+    """The measurements that got worse than the baseline
+
+    :return: (tuple) One line per API call regression and one line per time or memory regression
+    """
+    regressions = []
+    slower = []
+    for size, scenarios in sorted(results.items()):
+        for name, result in sorted(scenarios.items()):
+            base = baseline.get(size, {}).get(name)
+            if not base:
+                continue
+            if result["calls"] > base["calls"]:
+                regressions.append("{} {}: {} API calls, was {}".format(size, name, result["calls"], base["calls"]))
+            # Ignore differences too small to tell from noise
+            if result["wall_seconds"] > max(base["wall_seconds"] * (1 + time_tolerance), base["wall_seconds"] + 0.05):
+                slower.append("{} {}: {:.3f}s, was {:.3f}s".format(size, name, result["wall_seconds"],
+                                                                        base["wall_seconds"]))
+            if result["peak_kib"] > max(base["peak_kib"] * (1 + memory_tolerance), base["peak_kib"] + 64):
+                slower.append("{} {}: {:.0f} KiB at peak, was {:.0f} KiB".format(size, name, result["peak_kib"],
+                                                                              base["peak_kib"]))
+    return regressions, slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, nargs="+", default=[3], help="Upcoming events")
+    parser.add_argument("--rsvps", type=int, nargs="+", default=[10, 100, 500], help="RSVPs per event")
+    parser.add_argument("--tables", type=int, nargs="+", default=[5, 40], help="Tables per event")
+    parser.add_argument("--baseline", default=BASELINE, help="The baseline file")
+    parser.add_argument("--save", action="store_true", help="Store the results as the baseline")
+    parser.add_argument("--time-tolerance", type=float, default=0.5, help="Allowed slowdown, e.g. 0.5 for 50%%")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25, help="Allowed peak memory growth")
+    parser.add_argument("--strict", action="store_true",
+                        help="Fail on time and memory too. Only use with a baseline saved on this machine")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for events, rsvps, tables in product(args.events, args.rsvps, args.tables):
+        size = "events={},rsvps={},tables={}".format(events, rsvps, tables)
+        results[size] = run_size(events, rsvps, tables)
+        for name, result in sorted(results[size].items()):
+            print("{:<36} {:<50} {:>8.3f}s {:>10.1f} KiB {:>5} calls".format(
+                size, name, result["wall_seconds"], result["peak_kib"], result["calls"]))
+
+    if args.save:
+        baseline = {}
+        if path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print("Saved the baseline to {}".format(args.baseline))
+        return 0
+
+    if not path.exists(args.baseline):
+        print("No baseline at {}. Run with --save to create one".format(args.baseline))
+        return 0
+    with open(args.baseline) as f:
+        regressions, slower = compare(results, json.load(f), args.time_tolerance, args.memory_tolerance)
+    if args.strict:
+        regressions += slower
+    else:
+        for line in slower:
+            print("SLOWER " + line)
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,20 +2,40 @@
 
 import json
 import random
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone, timedelta
 from os import environ
-from time import sleep
-
-from fuzzywuzzy import process
+from threading import Lock
+from time import monotonic, sleep
 
+from dave import metrics
+from dave.cache import TTLCache
+from dave.commands import CommandRouter
 from dave.data_types import Event
 from dave.log import logger
-from dave.meetup import MeetupGroup
-from dave.slack import Slack
+from dave.meetup import MeetupClient, MeetupGroup
+from dave.reconcile import reconcile, Watermark
+from dave.resolver import CHANNEL_FOR_VENUE, EventResolver
+from dave.scheduler import SyncScheduler
+from dave.slack import Announcer, Slack
+from dave.state import Database, EventState, EventStore, MemberStore, SnapshotStore, SyncState
 from dave.trello_boards import TrelloBoard
-from dave.exceptions import NoBoardError
+from dave.exceptions import NoBoardError, MeetupError
+
+# The longest the monitor sleeps between two looks at the upcoming events
+sleep_time = int(environ.get('CHECK_TIME', '60'))
 
-sleep_time = int(environ.get('CHECK_TIME', '600'))
+SYNC_STAGE_SECONDS = metrics.REGISTRY.histogram("dave_sync_stage_seconds", "How long each stage of check_events took")
+SYNCED_EVENTS = metrics.REGISTRY.counter("dave_synced_events_total", "Events synced with their Trello board")
+RSVP_CHANGES = metrics.REGISTRY.counter("dave_rsvp_changes_total", "New and canceled RSVPs written to Trello")
+NEXT_CHECK = metrics.REGISTRY.gauge("dave_next_check_seconds", "How long the monitor sleeps before its next check")
+CACHE_HITS = metrics.REGISTRY.counter("dave_cache_hits_total", "Reads served from a cache")
+CACHE_MISSES = metrics.REGISTRY.counter("dave_cache_misses_total", "Reads a cache couldn't serve")
+CACHE_ENTRIES = metrics.REGISTRY.gauge("dave_cache_entries", "Entries in a cache")
+THROTTLE_TOKENS = metrics.REGISTRY.counter("dave_throttle_tokens_total", "Requests let through by a rate limiter")
+THROTTLE_WAIT = metrics.REGISTRY.counter("dave_throttle_wait_seconds_total",
+                                         "Seconds spent waiting for a rate limiter to let a request through")
 
 
 class Bot(object):
@@ -28,17 +48,46 @@ class Bot(object):
         bot_id = environ.get("BOT_ID")
         self.lab_channel_id = environ.get("LAB_CHANNEL_ID")
         self.team_name = environ["TRELLO_TEAM"]
-        self.storg = MeetupGroup(meetup_key, group_id)
+        api_concurrency = int(environ.get("API_CONCURRENCY", "4"))
+        self.sync_workers = int(environ.get("SYNC_WORKERS", "4"))
+        self._event_locks = defaultdict(Lock)
+        self._event_locks_lock = Lock()
+        # The members whose RSVP sits on each event's watermark, so they aren't replayed at the next sync
+        self._seen_at_watermark = {}
+        self.storg = MeetupGroup(meetup_key, group_id, client=MeetupClient(max_concurrency=api_concurrency),
+                                 events_ttl=int(environ.get("MEETUP_EVENTS_TTL", "60")))
         self.chat = Slack(slack_token, bot_id)
-        self.trello = TrelloBoard(api_key=trello_key, token=trello_token)
+        self.announcer = Announcer(self.chat)
+        self.db = Database()
+        self.published_events = EventStore(self.db)
+        self.published_max_age = int(environ.get("PUBLISHED_MAX_AGE", "1200"))
+        # Trello counts its rate limits over every process using our token and key. TRELLO_TOKEN_RATE and
+        # TRELLO_KEY_RATE are what the worker as a whole may use: worker.py splits them between its processes,
+        # and web.py keeps a tenth of Trello's limits for itself
+        self.trello = TrelloBoard(api_key=trello_key, token=trello_token, team_name=self.team_name,
+                                  cache_ttl=int(environ.get("TRELLO_CACHE_TTL", "300")),
+                                  snapshot_ttl=int(environ.get("TRELLO_SNAPSHOT_TTL", "60")),
+                                  max_concurrency=api_concurrency, snapshot_store=SnapshotStore(self.db),
+                                  store_max_age=self.published_max_age,
+                                  token_rate=float(environ.get("TRELLO_TOKEN_RATE", "9")),
+                                  key_rate=float(environ.get("TRELLO_KEY_RATE", "27")),
+                                  member_store=MemberStore(self.db))
+        self.state = SyncState(self.db)
+        self.scheduler = SyncScheduler(min_interval=int(environ.get("SYNC_MIN_INTERVAL", "60")),
+                                       max_interval=int(environ.get("SYNC_MAX_INTERVAL", "14400")),
+                                       budget=int(environ.get("SYNC_API_BUDGET", "200")))
+        self.commands = self._command_router()
+        self._rendered_tables = TTLCache(ttl=int(environ.get("TABLE_STATUS_TTL", "3600")))
+        self.trello.add_invalidation_hook(self._forget_rendered_tables)
+        self.resolver = EventResolver(aliases={"south": "STORG Clubhouse", "north": "STORG Northern Clubhouse"})
+        metrics.REGISTRY.add_collector(self._collect_metrics)
         with open("dave/resources/phrases.json", "r") as phrases:
             self._phrases = json.loads(phrases.read())
 
     def _handle_event(self, event: Event):
         cet = timezone(timedelta(0, 3600), "CET")
         # Check for new event
-        event_names = [b.name for b in self.trello.boards]
-        if event.name not in event_names:
+        if not self.trello.has_board(event.name):
             logger.info("New event found: {}".format(event.name))
             self.chat.message("Woohoo! We've got a new event coming up! :party_parrot:\n{}".format(event.event_url),
                               channel="#announcements")
@@ -47,47 +96,42 @@ class Bot(object):
     def _handle_rsvps(self, event: Event):
         event_name = event.name
         venue = event.venue["name"]
-        channel_for_venue = {"STORG Clubhouse": "#storg-south", "STORG Northern Clubhouse": "#storg-north"}
-        channel = channel_for_venue.get(venue)
-        newcomers = []
-        cancels = []
-        waitlist_names = []
-        newcomer_names = []
-        cancel_names = []
-
-        for rsvp in self.storg.rsvps(event.event_id):
-            member_name = rsvp.member["name"]
-            member_id = rsvp.member["member_id"]
-            known_participants = self.trello.participants(event.name)
-
-            if member_id not in known_participants and rsvp.response == "yes":
-                self.trello.add_rsvp(name=member_name, member_id=member_id, board_name=event_name)
-                newcomers.append(member_id)
-                newcomer_names.append(member_name)
-                sleep(0.2)
-            elif member_id in known_participants and rsvp.response == "no":
-                self.trello.cancel_rsvp(member_id, board_name=event_name)
-                cancels.append(member_id)
-                cancel_names.append(member_name)
-            elif rsvp.response == "waitlist":
-                waitlist_names.append(member_name)
+        channel = CHANNEL_FOR_VENUE.get(venue)
 
-        spots_left = int(event.rsvp_limit) - int(event.yes_rsvp_count) if event.rsvp_limit else 'Unknown'
+        state = self.state.get(event.event_id)
+        if state and state.unchanged(event):
+            logger.info("No changes for {}".format(event_name))
+            return 0
 
-        if cancels:
-            logger.info("Cancellations found: {}".format(cancels))
-            self.chat.new_rsvp(', '.join(cancel_names), "no", event_name, spots_left, event.waitlist_count, channel)
-            # logger.debug("Participant list: {}".format(known_participants))
-            return
+        watermark = Watermark(since=state.watermark if state else None,
+                              seen=self._seen_at_watermark.get(event.event_id))
+        rsvps = self.storg.rsvps(event.event_id, only=("member", "response", "mtime"))
+        known_participants = self.trello.participants(event_name)
+        diff = reconcile(watermark.filter(rsvps), known_participants, self.trello.canceled(event_name))
 
-        if newcomers:
-            logger.info("Newcomers found: {}".format(newcomers))
-            self.chat.new_rsvp(', '.join(newcomer_names), "yes", event_name, spots_left, event.waitlist_count,
-                               channel)
-            # logger.debug("Participant list: {}".format(known_participants))
-            return
+        for rsvp in diff.newcomers:
+            self.trello.add_rsvp(name=rsvp.member["name"], member_id=rsvp.member["member_id"], board_name=event_name)
+        for rsvp in diff.cancels:
+            self.trello.cancel_rsvp(rsvp.member["member_id"], board_name=event_name)
+
+        self.state.save(EventState(event.event_id, yes_rsvp_count=event.yes_rsvp_count,
+                                   waitlist_count=event.waitlist_count, updated=event.updated,
+                                   watermark=watermark.latest))
+        self._seen_at_watermark[event.event_id] = watermark.seen
+
+        spots_left = int(event.rsvp_limit) - int(event.yes_rsvp_count) if event.rsvp_limit else 'Unknown'
+        # On the first sync everyone on the waitlist would look new
+        waitlisted = diff.waitlist_names if state else []
+
+        if diff or waitlisted:
+            logger.info("Newcomers: {}, cancellations: {}, waitlisted: {}".format(diff.newcomer_names,
+                                                                                 diff.cancel_names, waitlisted))
+            self.announcer.rsvps(channel, event_name, joined=diff.newcomer_names, canceled=diff.cancel_names,
+                                 waitlisted=waitlisted, spots=spots_left, waitlist=event.waitlist_count)
+            return len(diff.newcomers) + len(diff.cancels)
 
         logger.info("No changes for {}".format(event_name))
+        return 0
 
     def _check_for_greeting(self, sentence):
         """If any of the words in the user's input was a greeting, return a greeting response"""
@@ -105,21 +149,36 @@ class Bot(object):
         resp = ' and'.join(resp.rsplit(',', 1))
         return resp
 
+    def _upcoming_events(self):
+        """The upcoming events as the monitor last published them, or as Meetup has them if that was too long ago"""
+        events = self.published_events.get(self.storg.group_id, max_age=self.published_max_age)
+        if events is None:
+            events = self.storg.upcoming_events
+        return events
+
     def _next_event_info(self):
         try:
-            next_event = self.storg.next_event
+            next_event = self._upcoming_events()[0]
             event_time = next_event.time / 1000
             date = datetime.fromtimestamp(event_time).strftime('%A %B %d at %H:%M')
             name = next_event.name
             msg = "Our next event is *{}* on {}. Info and RSVP at {}".format(name, date, next_event.event_url)
         except IndexError:
             msg = "I can't find any event :disappointed:"
+        except MeetupError as e:
+            logger.error(e)
+            msg = "I can't reach Meetup right now :disappointed:"
         return msg
 
     def _all_events_info(self):
         intro = ["Here are our next events.\n"]
         msgs = []
-        for event in self.storg.upcoming_events:
+        try:
+            events = self._upcoming_events()
+        except MeetupError as e:
+            logger.error(e)
+            return "I can't reach Meetup right now :disappointed:"
+        for event in events:
             event_time = event.time / 1000
             date = datetime.fromtimestamp(event_time).strftime('%A %B %d at %H:%M')
             name = event.name
@@ -130,21 +189,38 @@ class Bot(object):
 
     def _tables_info(self, channel, request=None, detail=False, only_available=False, table_number=None):
         logger.debug("Got {} and {}".format(channel, request))
-        if not request and channel:
-            request = ' '.join(channel.split("_"))
-
-        logger.debug("Request {}".format(request))
-        logger.debug("Channel {}".format(channel))
-        events = self.storg.event_names
-        logger.debug("Events {}".format(events))
-        event_name = process.extractOne(request, events)[0]
+        self.resolver.update(self._upcoming_events())
+        event_name = self.resolver.resolve(request, channel)
         logger.debug("Chose {}".format(event_name))
+        if not event_name:
+            return "I didn't find anything :disappointed:"
+
+        try:
+            board_id, version = self.trello.board_version(event_name)
+        except NoBoardError:
+            return "I didn't find anything :disappointed:"
+
+        view = (board_id, detail, only_available, table_number)
+        rendered = self._rendered_tables.get(view)
+        if rendered and rendered[0] == version:
+            logger.debug("Table status for {} hasn't changed since {}".format(event_name, version))
+            return rendered[1]
 
         try:
             tables_for_event = self.trello.tables_for_event(event_name)
         except NoBoardError:
             return "I didn't find anything :disappointed:"
+        attachments = self._render_tables(tables_for_event, detail, only_available, table_number)
+        self._rendered_tables.set(view, (version, attachments))
+        return attachments
 
+    def _forget_rendered_tables(self, board_id):
+        if board_id:
+            self._rendered_tables.invalidate_where(lambda view: view[0] == board_id)
+        else:
+            self._rendered_tables.clear()
+
+    def _render_tables(self, tables_for_event, detail, only_available, table_number):
         tables = []
 
         for table in tables_for_event.values():
@@ -185,22 +261,102 @@ class Bot(object):
             tables.append(attachment)
         return json.dumps(tables)
 
-    def check_events(self):
-        logger.info("Checking for event updates")
-        for event in self.storg.upcoming_events:
-            self._handle_event(event)
-            self._handle_rsvps(event)
-        logger.info("Done checking")
+    def _sync_event(self, event: Event) -> float:
+        """Syncs one event, unless it's already being synced, and schedules its next sync
 
-    def monitor_events(self, sleep_for=900):
-        while True:
+        :return: (float) How long it took, in seconds
+        """
+        with self._event_locks_lock:
+            lock = self._event_locks[event.event_id]
+        if not lock.acquire(blocking=False):
+            logger.info("{} is already being synced".format(event.name))
+            return 0.0
+
+        started = monotonic()
+        changes = 0
+        try:
+            with SYNC_STAGE_SECONDS.time(stage="board"):
+                self._handle_event(event)
             try:
-                self.check_events()
-            except Exception as e:
-                self.chat.message("Swallowed exception at check_events: {}".format(e), self.lab_channel_id)
-                logger.error("Swallowed exception at check_events: {}".format(e))
-                raise e
-            sleep(sleep_for)
+                with SYNC_STAGE_SECONDS.time(stage="rsvps"):
+                    changes = self._handle_rsvps(event)
+            except MeetupError as e:
+                logger.error("Skipping RSVPs for {}: {}".format(event.name, e))
+            try:
+                with SYNC_STAGE_SECONDS.time(stage="publish_board"):
+                    self.trello.publish(event.name)
+            except NoBoardError:
+                logger.error("Couldn't publish the board of {}".format(event.name))
+        finally:
+            lock.release()
+        SYNCED_EVENTS.inc()
+        RSVP_CHANGES.inc(changes)
+        next_sync = self.scheduler.synced(event, changes)
+        logger.debug("Next sync of {} in {:.0f}s".format(event.name, next_sync))
+        return monotonic() - started
+
+    def _api_calls(self):
+        return self.storg.client.calls + self.trello.tc.throttle_stats["token"]["consumed"]
+
+    def check_events(self):
+        """Syncs the events that are due, as many as the scheduler's API budget allows"""
+        started = monotonic()
+        try:
+            with SYNC_STAGE_SECONDS.time(stage="events"):
+                events = self.storg.upcoming_events
+        except MeetupError as e:
+            logger.error("Skipping this check: {}".format(e))
+            return
+        with SYNC_STAGE_SECONDS.time(stage="publish_events"):
+            self.published_events.put(self.storg.group_id, events)
+        due = self.scheduler.due(events)
+        if not due:
+            return
+        logger.info("Checking {} of {} events for updates".format(len(due), len(events)))
+
+        calls = self._api_calls()
+        timings = {}
+        with SYNC_STAGE_SECONDS.time(stage="sync"), ThreadPoolExecutor(max_workers=self.sync_workers) as pool:
+            syncs = {pool.submit(self._sync_event, event): event for event in due}
+            for sync in as_completed(syncs):
+                timings[syncs[sync].name] = sync.result()
+        calls = self._api_calls() - calls
+        self.scheduler.spent(calls, len(due))
+        SYNC_STAGE_SECONDS.observe(monotonic() - started, stage="cycle")
+        summary = ', '.join("{}: {:.1f}s".format(name, took) for name, took in timings.items())
+        logger.info("Done checking in {:.1f}s with {:.0f} API calls. {}".format(monotonic() - started, calls, summary))
+
+    def sync(self, sleep_for=None):
+        """Checks the events that are due once, reporting any failure to the lab channel before raising it
+
+        :param sleep_for: (int) The longest to wait before the next check. Defaults to $CHECK_TIME
+        :return: (float) Seconds to wait before the next check
+        """
+        try:
+            self.check_events()
+        except Exception as e:
+            self.chat.message("Swallowed exception at check_events: {}".format(e), self.lab_channel_id)
+            logger.error("Swallowed exception at check_events: {}".format(e))
+            raise e
+        next_check = self.scheduler.sleep_time(longest=sleep_for or sleep_time)
+        NEXT_CHECK.set(next_check)
+        return next_check
+
+    def _collect_metrics(self):
+        caches = {"trello_" + name: stats for name, stats in self.trello.cache_stats.items()}
+        caches["rendered_tables"] = self._rendered_tables.stats
+        caches["resolved_events"] = self.resolver.cache_stats
+        for name, stats in caches.items():
+            CACHE_HITS.set(stats["hits"], cache=name)
+            CACHE_MISSES.set(stats["misses"], cache=name)
+            CACHE_ENTRIES.set(stats["size"], cache=name)
+        for name, stats in self.trello.tc.throttle_stats.items():
+            THROTTLE_TOKENS.set(stats["consumed"], limiter="trello_" + name)
+            THROTTLE_WAIT.set(stats["waited_seconds"], limiter="trello_" + name)
+
+    def monitor_events(self, sleep_for=None):
+        while True:
+            sleep(self.sync(sleep_for))
 
     def read_chat(self, tasks):
         self.chat.rtm(tasks)
@@ -211,70 +367,103 @@ class Bot(object):
     def table(self, event_name, table_title):
         return self.trello.table(event_name, table_title)
 
+    def _command_router(self) -> CommandRouter:
+        """Every command the bot understands, in the order they are tried"""
+        commands = CommandRouter(fallback=self._chatter)
+        commands.add("help", r"help", self._help)
+        commands.add("table_status", r"table status", self._table_status)
+        commands.add("available_tables", r"available tables", self._available_tables)
+        commands.add("detailed_table_status", r"detailed table status", self._detailed_table_status)
+        commands.add("table", r"table\s*(?P<table_number>\d+)\s*(?P<table_request>.*)", self._table)
+        commands.add("next_event", r"(?!.*events).*next event", self._next_event)
+        commands.add("events", r".*events", self._events)
+        commands.add("thanks", r".*(?:thanks|thank you)", self._thanks)
+        commands.add("man", r"(?:what can you do|man\Z)", self._man)
+        commands.add("admin_info", r".*admin info", self._admin_info)
+        commands.add("add_table_help", r"add table\Z", self._add_table_help)
+        commands.add("add_table", r"add table", self._add_table_command)
+        return commands
+
+    def _help(self, command, match, channel_id):
+        return "Hold on tight, I'm coming!\nJust kidding!\n\n{}".format(self._phrases["responses"]["help"]), None, False
+
+    def _table_status(self, command, match, channel_id):
+        return "Open tables", self._tables_info(channel=self.chat.channel_name(channel_id),
+                                                request=command[match.end():], only_available=False), True
+
+    def _available_tables(self, command, match, channel_id):
+        return "Available tables", self._tables_info(channel=self.chat.channel_name(channel_id),
+                                                     request=command[match.end():], only_available=True), True
+
+    def _detailed_table_status(self, command, match, channel_id):
+        return "Available tables", self._tables_info(channel=self.chat.channel_name(channel_id),
+                                                     request=command[match.end():], detail=True,
+                                                     only_available=False), True
+
+    def _table(self, command, match, channel_id):
+        table_number = int(match.group("table_number"))
+        request = match.group("table_request") or None
+        logger.debug("Table {}".format(table_number))
+        return "Details for table {}".format(table_number), \
+               self._tables_info(channel=self.chat.channel_name(channel_id), request=request, detail=True,
+                                 table_number=table_number), True
+
+    def _next_event(self, command, match, channel_id):
+        return self._next_event_info(), None, False
+
+    def _events(self, command, match, channel_id):
+        return self._all_events_info(), None, False
+
+    def _thanks(self, command, match, channel_id):
+        return random.choice(self._phrases["responses"]["thanks"]), None, False
+
+    def _man(self, command, match, channel_id):
+        return self._phrases["responses"]["help"], None, False
+
+    def _admin_info(self, command, match, channel_id):
+        return self._phrases["responses"]["admin_info"], None, True
+
+    def _add_table_help(self, command, match, channel_id):
+        return "Sure thing. Just send me a message in the following format:\n" \
+               "add table <TABLE TITLE>: <BLURB>, Players: <MAX NUMBER OF PLAYERS>, e.g.\n" \
+               "```add table Rat Queens (Fate): One more awesome Rat Queens adventure, Players: 5```", None, True
+
+    def _add_table_command(self, command, match, channel_id):
+        return self._add_table(command, channel_id), None, True
+
+    def _chatter(self, command, match, channel_id):
+        greeting = self._check_for_greeting(command)
+        return greeting or random.choice(self._phrases["responses"]["unknown"]), None, False
+
     def conversation(self, task_queue):
-        unknown_responses = self._phrases["responses"]["unknown"]
         while True:
-            try:
-                command, channel_id, user_id, thread = task_queue.get()
-                attachments = None
-                if command.startswith("help"):
-                    response = "Hold on tight, I'm coming!\nJust kidding!\n\n{}".format(
-                        self._phrases["responses"]["help"])
-                    thread=None
-                elif command.lower().startswith("table status"):
-                    response = "Open tables"
-                    attachments = self._tables_info(channel=self.chat.channel_name(channel_id),
-                                                    request=command.split('table status')[-1], only_available=False)
-                elif command.lower().startswith("available tables"):
-                    response = "Available tables"
-                    attachments = self._tables_info(channel=self.chat.channel_name(channel_id),
-                                                    request=command.split('available tables')[-1], only_available=True)
-                elif command.lower().startswith("detailed table status"):
-                    response = "Available tables"
-                    attachments = self._tables_info(channel=self.chat.channel_name(channel_id),
-                                                    request=command.split('table status')[-1], detail=True,
-                                                    only_available=False)
-                elif command.lower().startswith("table"):
-                    full_req = command.split('table')[-1].strip()
-                    split_req = full_req.split(" ", 1)
-                    table_number = int(split_req[0])
-                    if len(split_req) == 2:
-                        request = split_req[1]
-                    else:
-                        request = None
-                    logger.debug("Table {}".format(table_number))
-                    response = "Details for table {}".format(table_number)
-                    attachments = self._tables_info(channel=self.chat.channel_name(channel_id),
-                                                    request=request, detail=True, table_number=table_number)
-                elif "next event" in command.lower() and "events" not in command.lower():
-                    response = self._next_event_info()
-                    thread = None
-                elif "events" in command.lower():
-                    thread = None
-                    response = self._all_events_info()
-                elif "thanks" in command.lower() or "thank you" in command.lower():
-                    thread = None
-                    response = random.choice(self._phrases["responses"]["thanks"])
-                elif command.lower().startswith("what can you do") or command.lower() == "man":
-                    thread = None
-                    response = self._phrases["responses"]["help"]
-                elif "admin info" in command.lower():
-                    response = self._phrases["responses"]["admin_info"]
-                elif "add table" == command.lower():
-                    response = "Sure thing. Just send me a message in the following format:\n" \
-                               "add table <TABLE TITLE>: <BLURB>, Players: <MAX NUMBER OF PLAYERS>, e.g.\n" \
-                               "```add table Rat Queens (Fate): One more awesome Rat Queens adventure, Players: 5```"
-                elif command.lower().startswith("add table"):
-                    response = self._add_table(command, channel_id)
-                else:
-                    thread = None
-                    response = self._check_for_greeting(command) if self._check_for_greeting(
-                        command) else random.choice(
-                        unknown_responses)
-                self.respond(response, channel_id, attachments=attachments, thread=thread)
-            except Exception as e:
-                self.chat.message("Swallowed exception at conversation: {}".format(e), self.lab_channel_id)
-                logger.error("Swallowed exception at conversation: {}".format(e))
+            self.answer(task_queue.get(), task_queue)
+
+    def answer(self, task, task_queue=None):
+        """Answers one command read from the chat
+
+        :param task: (tuple) The command, the channel id, the user id and the thread it was asked in
+        :param task_queue: (queue) Where it came from, to log how many commands are still waiting
+        """
+        try:
+            command, channel_id, user_id, thread = task
+            started = monotonic()
+            name, (response, attachments, in_thread) = self.commands.dispatch(command, channel_id)
+            self.respond(response, channel_id, attachments=attachments, thread=thread if in_thread else None)
+            logger.info("Answered {} in {:.2f}s, {} commands waiting".format(
+                name or "chatter", monotonic() - started, self._queue_depth(task_queue)))
+        except Exception as e:
+            self.chat.message("Swallowed exception at conversation: {}".format(e), self.lab_channel_id)
+            logger.error("Swallowed exception at conversation: {}".format(e))
+
+    @staticmethod
+    def _queue_depth(task_queue):
+        if task_queue is None:
+            return "?"
+        try:
+            return task_queue.qsize()
+        except NotImplementedError:
+            return "?"
 
     def _add_table(self, command, channel_id):
         title, info = command.split(":", 1)
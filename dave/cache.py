@@ -0,0 +1,80 @@
+""" A small time-bounded cache with explicit invalidation """
+from threading import RLock
+from time import monotonic
+from typing import Any, Callable, Hashable
+
+
+class TTLCache(object):
+    def __init__(self, ttl: float = 300, maxsize: int = 128, clock: Callable[[], float] = monotonic) -> None:
+        """Creates a cache whose entries expire :ttl: seconds after they were stored
+
+        :param ttl: (float) Seconds an entry stays valid
+        :param maxsize: (int) Maximum number of entries. The ones closest to expiring are dropped first
+        :param clock: (callable) Returns the current time in seconds. Handy for tests
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._entries = {}
+        self._lock = RLock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """The value stored under :key:, or :default: if it's missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > self._clock():
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(key, None)
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.maxsize:
+                self._evict()
+            self._entries[key] = (self._clock() + self.ttl, value)
+
+    def get_or_set(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Returns the value stored under :key:, calling :loader: to fill it in when missing or expired.
+        Exceptions raised by :loader: are not cached.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        """Drops every entry whose key matches :predicate:"""
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self) -> None:
+        now = self._clock()
+        expired = [k for k, (expires, _) in self._entries.items() if expires <= now]
+        for key in expired:
+            del self._entries[key]
+        if len(self._entries) >= self.maxsize:
+            oldest = min(self._entries, key=lambda k: self._entries[k][0])
+            del self._entries[oldest]
+
+    @property
+    def stats(self) -> dict:
+        """Hit and miss counters, plus the current number of entries"""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,82 @@
+""" Routes chat commands to the functions that answer them """
+import re
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Optional, Tuple
+
+from dave import metrics
+
+COMMAND_SECONDS = metrics.REGISTRY.histogram("dave_command_seconds", "How long answering each chat command took")
+COMMAND_ERRORS = metrics.REGISTRY.counter("dave_command_errors_total", "Chat commands whose handler failed")
+
+
+class CommandRouter(object):
+    def __init__(self, fallback: Callable = None) -> None:
+        """Matches commands against all registered patterns at once with a single compiled regex
+
+        :param fallback: (callable) Handles the commands no pattern matches
+        """
+        self.fallback = fallback
+        self._routes = []
+        self._handlers = {}
+        self._regex = None
+        self._lock = Lock()
+        self._stats = {}
+
+    def add(self, name: str, pattern: str, handler: Callable) -> None:
+        """Registers :handler: for the commands matching :pattern:.
+        Patterns are tried in the order they were added, anchored at the start of the command and ignoring case.
+
+        :param name: (str) The command's name. Must be a valid Python identifier
+        :param pattern: (str) A regex. Named groups are passed on to the handler through the match
+        :param handler: (callable) Called with the command, the match object and any extra dispatch arguments
+        """
+        self._routes.append((name, pattern))
+        self._handlers[name] = handler
+        self._regex = None
+
+    def _compiled(self):
+        if self._regex is None:
+            self._regex = re.compile("|".join("(?P<{}>{})".format(name, pattern) for name, pattern in self._routes),
+                                     re.IGNORECASE | re.DOTALL)
+        return self._regex
+
+    def match(self, command: str) -> Tuple[Optional[str], Optional[Callable], Optional[Any]]:
+        """Finds the handler for :command:
+
+        :return: (tuple) The command's name, its handler and the match object, or Nones if nothing matched
+        """
+        match = self._compiled().match(command.strip())
+        if not match:
+            return None, self.fallback, None
+        # Route groups wrap everything else in their pattern, so they are always the last ones to close
+        return match.lastgroup, self._handlers[match.lastgroup], match
+
+    def dispatch(self, command: str, *args) -> Tuple[Optional[str], Any]:
+        """Runs the handler for :command:, timing it
+
+        :return: (tuple) The command's name (None for the fallback) and whatever the handler returned
+        """
+        name, handler, match = self.match(command)
+        started = monotonic()
+        try:
+            return name, handler(command.strip(), match, *args)
+        except Exception:
+            COMMAND_ERRORS.inc(command=name or "chatter")
+            raise
+        finally:
+            self._record(name, monotonic() - started)
+
+    def _record(self, name: Optional[str], seconds: float) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(name, {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+            stats["count"] += 1
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+        COMMAND_SECONDS.observe(seconds, command=name or "chatter")
+
+    @property
+    def stats(self) -> dict:
+        """How many times each command ran and how long it took, in total and at worst"""
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
@@ -23,8 +23,9 @@ class Event:
     Class to create Event() objects
     """
     def __init__(self, id: int, name: str, time: int, status: str, rsvp_limit: int, waitlist_count: int,
-                 yes_rsvp_count: int, announced: bool, event_url: str, venue: dict,
+                 yes_rsvp_count: int, announced: bool, event_url: str, venue: dict, updated: int = None,
                  **kwargs: dict) -> None:
+        self.updated = updated
         self.venue = venue
         self.event_url = event_url
         self.announced = announced
@@ -48,7 +49,9 @@ class Rsvp:
     """
     Class to create Rsvp objects
     """
-    def __init__(self, venue: str, response: str, answers: List[str], member: dict, **kwargs: dict) -> None:
+    def __init__(self, venue: str = None, response: str = None, answers: List[str] = None, member: dict = None,
+                 mtime: int = None, **kwargs: dict) -> None:
+        self.mtime = mtime
         self.member = member
         self.answers = answers
         self.response = response
@@ -4,3 +4,8 @@
 class NoBoardError(Exception):
     """ Board not found"""
     pass
+
+
+class MeetupError(Exception):
+    """ The Meetup API couldn't be reached or returned an error"""
+    pass
@@ -1,67 +1,252 @@
 """ Module to get info from Meetup """
-from typing import List
+import random
+from threading import BoundedSemaphore, Lock
+from time import monotonic, sleep
+from typing import Iterable, Iterator, List
+from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
 
+from dave import metrics
 from dave.data_types import Event, Rsvp
+from dave.exceptions import MeetupError
 from dave.log import logger
 
 
+class MeetupClient:
+    """ A keep-alive HTTP client for the Meetup API that retries failed calls and paces itself
+    according to the rate limit headers Meetup sends back """
+    retry_statuses = {429, 500, 502, 503, 504}
+
+    def __init__(self, api_url="https://api.meetup.com", timeout=10, retries=3, backoff=1.0, pool_size=10,
+                 low_watermark=5, max_concurrency=4):
+        """
+        :param api_url: (str) Base URL of the API
+        :param timeout: (float) Seconds to wait for Meetup to connect and to answer
+        :param retries: (int) How many times to retry a failed call
+        :param backoff: (float) Base delay in seconds between retries. Doubles with every retry
+        :param pool_size: (int) Number of kept-alive connections
+        :param low_watermark: (int) Start spreading calls out when fewer requests than this are left in the window
+        :param max_concurrency: (int) Maximum number of calls in flight at the same time
+        """
+        self.api_url = api_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.low_watermark = low_watermark
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = Lock()
+        self._slots = BoundedSemaphore(max_concurrency)
+        self._remaining = None
+        self._reset_at = None
+        self.calls = 0
+
+    def get(self, path: str, params: dict) -> dict:
+        """ Do a GET towards the Meetup API
+        :param path: (str) The path to GET
+        :param params: (dict) Extra parameters to pass to the request
+        :return: (dict) The decoded response
+        :raises MeetupError: if Meetup still fails after all retries
+        """
+        return self.json(self.request(path, params))
+
+    @staticmethod
+    def json(resp: requests.Response) -> dict:
+        try:
+            return resp.json()
+        except ValueError as e:
+            raise MeetupError("GET {} returned invalid JSON".format(resp.url)) from e
+
+    def request(self, path: str, params: dict, headers: dict = None) -> requests.Response:
+        """ Do a GET towards the Meetup API, retrying if needed
+        :param path: (str) The path to GET, or a full URL such as the "next" link of a paginated response
+        :param params: (dict) Extra parameters to pass to the request
+        :param headers: (dict) Extra headers, e.g. for conditional requests
+        :return: (Response) A response with status 200, or 304 for a conditional request
+        :raises MeetupError: if Meetup still fails after all retries
+        """
+        url = path if path.startswith("http") else self.api_url + path
+        endpoint = urlsplit(url).path
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._backoff(attempt, error)
+            self._pace()
+            with self._lock:
+                self.calls += 1
+            started = monotonic()
+            try:
+                with self._slots:
+                    resp = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                metrics.observe_api("meetup", endpoint, type(e).__name__, monotonic() - started)
+                error = MeetupError("GET {} failed: {}".format(url, e))
+                continue
+
+            metrics.observe_api("meetup", endpoint, resp.status_code, monotonic() - started)
+            self._track_rate_limit(resp)
+            if resp.status_code in (200, 304):
+                return resp
+
+            error = MeetupError("GET {} returned {}: {}".format(url, resp.status_code, resp.text[:200]))
+            error.response = resp
+            if resp.status_code not in self.retry_statuses:
+                raise error
+        raise error
+
+    def _backoff(self, attempt: int, error: MeetupError) -> None:
+        delay = random.uniform(0, self.backoff * 2 ** (attempt - 1))
+        response = getattr(error, "response", None)
+        if response is not None and response.status_code == 429:
+            delay = max(delay, self._seconds_until_reset())
+        logger.warning("{}. Retrying in {:.1f}s".format(error, delay))
+        metrics.API_SLEEP.inc(delay, api="meetup", reason="backoff")
+        sleep(delay)
+
+    def _track_rate_limit(self, resp: requests.Response) -> None:
+        try:
+            remaining = int(resp.headers["X-RateLimit-Remaining"])
+            reset = float(resp.headers["X-RateLimit-Reset"])
+        except (KeyError, ValueError):
+            return
+        with self._lock:
+            self._remaining = remaining
+            self._reset_at = monotonic() + reset
+
+    def _seconds_until_reset(self) -> float:
+        if self._reset_at is None:
+            return 0
+        return max(0.0, self._reset_at - monotonic())
+
+    def _pace(self) -> None:
+        """ Waits before a call when we're about to run out of requests in the current rate limit window """
+        with self._lock:
+            remaining = self._remaining
+            wait = self._seconds_until_reset()
+            if remaining is not None and remaining > 0:
+                self._remaining -= 1
+        if remaining is None or wait == 0 or remaining >= self.low_watermark:
+            return
+        if remaining > 0:
+            wait /= remaining
+        logger.debug("{} Meetup requests left, waiting {:.1f}s".format(remaining, wait))
+        metrics.API_SLEEP.inc(wait, api="meetup", reason="rate_limit")
+        sleep(wait)
+
+
 class MeetupGroup:
     """ Creates a Meetup Group object """
-    def __init__(self, api_key, group_id):
+    def __init__(self, api_key, group_id, client=None, events_ttl=60):
         """
         :param api_key: (str) The API key for your Meetup account
         :param group_id: (int) The group_id of the Meetup Group. Get it at GET /2/groups
+        :param client: (MeetupClient) The HTTP client to use. A new one is created if None
+        :param events_ttl: (float) Seconds to reuse the upcoming events before asking Meetup whether they changed
         """
-        self.api_url = "http://api.meetup.com"
+        self.client = client or MeetupClient()
         self.api_key = api_key
         self.group_id = group_id
+        self.events_ttl = events_ttl
+        self._events = None
+        self._events_checked_at = None
+        self._events_validators = {}
+        self._events_lock = Lock()
+
+    def _upcoming(self) -> List[Event]:
+        """ The upcoming events sorted by time, fetched again only when older than :events_ttl:
+        and only downloaded again if Meetup says they changed
+        """
+        with self._events_lock:
+            if self._events is not None and monotonic() - self._events_checked_at < self.events_ttl:
+                return self._events
+
+            params = {"key": self.api_key, "group_id": self.group_id, "status": "upcoming"}
+            headers = {}
+            if self._events is not None and "ETag" in self._events_validators:
+                headers["If-None-Match"] = self._events_validators["ETag"]
+            if self._events is not None and "Last-Modified" in self._events_validators:
+                headers["If-Modified-Since"] = self._events_validators["Last-Modified"]
+
+            resp = self.client.request("/2/events", params, headers=headers)
+            if resp.status_code == 304:
+                logger.debug("Upcoming events haven't changed")
+            else:
+                events = self._paginate("/2/events", first=self.client.json(resp))
+                self._events = sorted([Event(**e) for e in events], key=lambda event: event.time)
+                self._events_validators = {h: resp.headers[h] for h in ("ETag", "Last-Modified") if h in resp.headers}
+            self._events_checked_at = monotonic()
+            return self._events
+
+    def invalidate_events(self) -> None:
+        """ Makes the next read of the upcoming events ask Meetup again """
+        with self._events_lock:
+            self._events_checked_at = None
+            self._events = None
 
     @property
     def upcoming_events(self) -> List[Event]:
         """ All the upcoming events
-        :return: a list of all the upcoming events
+        :return: a list of all the upcoming events, sorted by time
         """
-        params = {"key": self.api_key, "group_id": self.group_id, "status": "upcoming"}
-        events = self._get("/2/events", params)
-        return [Event(**e) for e in events]
+        return list(self._upcoming())
 
     @property
     def next_event(self) -> Event:
         """
         :return: the next event
         """
-        return sorted(self.upcoming_events, key=lambda event: event.time)[0]
+        return self._upcoming()[0]
 
     @property
     def event_names(self) -> List[str]:
         """
         :return: list of all upcoming event names
         """
-        return [e.name for e in self.upcoming_events]
+        return [e.name for e in self._upcoming()]
 
-    def rsvps(self, event_id: str) -> List[Rsvp]:
-        """Get's all RSVPs for a specific event
+    def rsvps(self, event_id: str, only: Iterable[str] = None, fields: Iterable[str] = None,
+              page_size: int = 200) -> Iterator[Rsvp]:
+        """Get's all RSVPs for a specific event, page by page as they are consumed
         https://secure.meetup.com/meetup_api/console/?path=/2/rsvps
 
         :param event_id: (str) The id of the event you're querying
-        :return: (list) A list of dicts, one dict per RSVP
+        :param only: (list) Return only these fields of each RSVP, e.g. ("member", "response")
+        :param fields: (list) Optional fields Meetup should add to each RSVP
+        :param page_size: (int) How many RSVPs to fetch per request
+        :return: (generator) One Rsvp per RSVP
         """
-        params = {"event_id": event_id, "key": self.api_key}
-        rsvps = self._get("/2/rsvps", params)
-        return [Rsvp(**r) for r in rsvps]
+        params = {"event_id": event_id, "key": self.api_key, "page": page_size}
+        if only:
+            params["only"] = ",".join(only)
+        if fields:
+            params["fields"] = ",".join(fields)
+        for rsvp in self._paginate("/2/rsvps", params):
+            yield Rsvp(**rsvp)
 
-    def _get(self, path: str, params: dict) -> list:
-        """ Do a GET towards the Meetup API
+    def _paginate(self, path: str, params: dict = None, first: dict = None) -> Iterator[dict]:
+        """ Do a GET towards the Meetup API and follow the "next" links of the response
         :param path: (str) The path to GET
-        :param params: (dict) Extra parameters to pass to the request
-        :return: (list) The "response" list contained in the Meetup API response
+        :param params: (dict) Extra parameters to pass to the first request
+        :param first: (dict) The first page, if it's already been fetched
+        :return: (generator) The items of the "results" list of every page
+        :raises MeetupError: if a call failed
         """
-        url = self.api_url + path
-        req = requests.get(url, params)
+        response = first if first is not None else self.client.get(path, params)
+        while True:
+            yield from self._results(response, path)
+            next_url = (response.get("meta") or {}).get("next")
+            if not next_url:
+                return
+            logger.debug("Fetching next page of {}".format(path))
+            response = self.client.get(next_url, None)
+
+    @staticmethod
+    def _results(response: dict, path: str) -> list:
         try:
-            return req.json()["results"]
-        except Exception:
-            logger.debug("GET {} failed: {}".format(self.api_url + path, req.headers))
-            return []
+            return response["results"]
+        except (KeyError, TypeError) as e:
+            raise MeetupError("GET {} returned no results: {}".format(path, response)) from e
@@ -0,0 +1,246 @@
+""" Counters, gauges and histograms about what the bot is doing, in the Prometheus text format
+https://prometheus.io/docs/instrumenting/exposition_formats/
+"""
+import re
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from os import environ
+from socketserver import ThreadingMixIn
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dave.log import logger
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+_ID = re.compile(r"(?<=/)(?:[0-9a-f]{24}|\d{4,})(?=/|$)")
+
+
+def endpoint(path: str) -> str:
+    """:path: with the ids left out, so that all the calls to the same endpoint share their metrics,
+    e.g. /1/boards/5b0d4d5c2b8d31f1e7a39a52/lists -> /1/boards/{id}/lists
+    """
+    return _ID.sub("{id}", path.split("?", 1)[0])
+
+
+def _labels(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format(name: str, labels: Tuple[Tuple[str, str], ...], value: float) -> str:
+    if labels:
+        escaped = ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                           for k, v in labels)
+        name = "{}{{{}}}".format(name, escaped)
+    return "{} {}".format(name, repr(float(value)))
+
+
+class _Metric(object):
+    kind = None
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = Lock()
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [_format(self.name, labels, value) for labels, value in sorted(self._values.items())]
+
+    def render(self) -> List[str]:
+        return ["# HELP {} {}".format(self.name, self.description),
+                "# TYPE {} {}".format(self.name, self.kind)] + self._samples()
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_labels(labels), 0.0)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, total: float, **labels) -> None:
+        """Sets the total of a counter that is kept somewhere else, e.g. in a cache's stats"""
+        with self._lock:
+            self._values[_labels(labels)] = total
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_labels(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, description)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes how long the with block took, in seconds"""
+        started = monotonic()
+        try:
+            yield
+        finally:
+            self.observe(monotonic() - started, **labels)
+
+    def value(self, **labels) -> Tuple[int, float]:
+        """How many values were observed and their sum"""
+        with self._lock:
+            counts, total = self._values.get(_labels(labels), ([0], 0.0))
+            return sum(counts), total
+
+    def _samples(self) -> List[str]:
+        samples = []
+        with self._lock:
+            for labels, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    samples.append(_format(self.name + "_bucket", labels + (("le", le),), cumulative))
+                samples.append(_format(self.name + "_sum", labels, total))
+                samples.append(_format(self.name + "_count", labels, cumulative))
+        return samples
+
+
+class Registry(object):
+    def __init__(self) -> None:
+        """All the metrics of a process, and the collectors that update the ones kept elsewhere before each read"""
+        self._metrics = {}
+        self._collectors = []
+        self._lock = Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing:
+                if type(existing) is not type(metric):
+                    raise ValueError("{} is already a {}".format(metric.name, existing.kind))
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self._register(Counter(name, description))
+
+    def gauge(self, name: str, description: str) -> Gauge:
+        return self._register(Gauge(name, description))
+
+    def histogram(self, name: str, description: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, buckets))
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """Registers :collector: to be called before every read, e.g. to copy cache stats into gauges"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text format"""
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning("Metrics collector {} failed: {}".format(collector, e))
+        return "".join(line + "\n" for metric in metrics for line in metric.render())
+
+    def serve(self, host: str = "0.0.0.0", port: int = 9100) -> HTTPServer:
+        """Serves the metrics at http://:host:::port:/metrics from a background thread"""
+        server = _Server((host, port), _Handler)
+        server.registry = self
+        Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        logger.info("Serving metrics on port {}".format(server.server_address[1]))
+        return server
+
+    def dump_every(self, interval: float) -> Event:
+        """Logs every metric every :interval: seconds from a background thread
+
+        :return: (Event) Set it to stop
+        """
+        stopped = Event()
+
+        def dump():
+            while not stopped.wait(interval):
+                logger.info("Metrics:\n{}".format(self.render()))
+
+        Thread(target=dump, name="metrics-dump", daemon=True).start()
+        return stopped
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+REGISTRY = Registry()
+
+API_REQUESTS = REGISTRY.counter("dave_api_requests_total", "Calls to the Meetup, Trello and Slack APIs")
+API_SECONDS = REGISTRY.histogram("dave_api_request_seconds", "How long calls to the Meetup, Trello and Slack APIs took")
+API_SLEEP = REGISTRY.counter("dave_api_sleep_seconds_total",
+                             "Seconds spent waiting before calling an API, to respect its rate limits or to back off")
+
+
+def observe_api(api: str, path: str, status, seconds: float, method: str = "GET") -> None:
+    """Records one call to an API
+
+    :param api: (str) meetup, trello or slack
+    :param path: (str) The path or method that was called. Ids are left out
+    :param status: The HTTP status, or what went wrong
+    :param seconds: (float) How long it took
+    :param method: (str) The HTTP method
+    """
+    path = endpoint(path)
+    API_REQUESTS.inc(api=api, method=method, endpoint=path, status=status)
+    API_SECONDS.observe(seconds, api=api, method=method, endpoint=path)
+
+
+def start(port_offset: int = 0) -> Optional[HTTPServer]:
+    """Exposes the metrics of this process as configured in the environment:
+    on $METRICS_PORT plus :port_offset:, and in the log every $METRICS_DUMP_INTERVAL seconds
+
+    :param port_offset: (int) Lets each process of the bot serve its own metrics on its own port
+    """
+    interval = environ.get("METRICS_DUMP_INTERVAL")
+    if interval:
+        REGISTRY.dump_every(float(interval))
+    port = environ.get("METRICS_PORT")
+    if port:
+        return REGISTRY.serve(port=int(port) + port_offset)
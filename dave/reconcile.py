@@ -0,0 +1,84 @@
+""" Work out what has to change on a Trello board to match an event's RSVPs on Meetup """
+from typing import Iterable, List
+
+from dave.data_types import Rsvp
+
+
+class RsvpDiff:
+    """ The changes needed to bring an event board in line with Meetup """
+    def __init__(self, newcomers: List[Rsvp] = None, cancels: List[Rsvp] = None,
+                 waitlist: List[Rsvp] = None) -> None:
+        self.newcomers = newcomers or []
+        self.cancels = cancels or []
+        self.waitlist = waitlist or []
+
+    @staticmethod
+    def _names(rsvps: List[Rsvp]) -> List[str]:
+        return [r.member["name"] for r in rsvps]
+
+    @property
+    def newcomer_names(self) -> List[str]:
+        return self._names(self.newcomers)
+
+    @property
+    def cancel_names(self) -> List[str]:
+        return self._names(self.cancels)
+
+    @property
+    def waitlist_names(self) -> List[str]:
+        return self._names(self.waitlist)
+
+    def __bool__(self):
+        return bool(self.newcomers or self.cancels)
+
+    def __repr__(self):
+        return "RsvpDiff(newcomers={}, cancels={}, waitlist={})".format(self.newcomer_names, self.cancel_names,
+                                                                        self.waitlist_names)
+
+
+def reconcile(rsvps: Iterable[Rsvp], participants: Iterable[int], canceled: Iterable[int] = ()) -> RsvpDiff:
+    """ Compare the RSVPs of an event with the members already on its board
+
+    :param rsvps: All the RSVPs of the event, as returned by Meetup
+    :param participants: The member ids found on the event's board
+    :param canceled: The member ids whose card is already labelled Canceled
+    :return: (RsvpDiff) Who has to be added and who has to be canceled
+    """
+    by_response = {"yes": {}, "no": {}, "waitlist": {}}
+    for rsvp in rsvps:
+        by_response.setdefault(rsvp.response, {})[rsvp.member["member_id"]] = rsvp
+
+    known = set(participants)
+    yes, no, waitlist = by_response["yes"], by_response["no"], by_response["waitlist"]
+    new_ids = yes.keys() - known
+    canceled_ids = no.keys() & (known - set(canceled))
+
+    # Dicts keep the order Meetup gave us, so announcements list people in the order they replied
+    return RsvpDiff(newcomers=[r for m, r in yes.items() if m in new_ids],
+                    cancels=[r for m, r in no.items() if m in canceled_ids],
+                    waitlist=list(waitlist.values()))
+
+
+class Watermark:
+    """ Lets through the RSVPs modified after :since:, keeping track of the latest modification seen.
+    RSVPs modified at :since: itself only get through if their member isn't in :seen:, so the RSVPs
+    on the watermark aren't replayed at every sync. When :seen: isn't known all of them are held back.
+    """
+    def __init__(self, since: int = None, seen: Iterable[int] = None) -> None:
+        self.since = since
+        self.latest = since
+        self._seen_before = set(seen) if seen is not None else None
+        self.seen = set(seen or ())
+
+    def filter(self, rsvps: Iterable[Rsvp]) -> Iterable[Rsvp]:
+        for rsvp in rsvps:
+            mtime = rsvp.mtime or 0
+            member_id = rsvp.member["member_id"]
+            if self.latest is None or mtime > self.latest:
+                self.latest = mtime
+                self.seen = set()
+            if mtime == self.latest:
+                self.seen.add(member_id)
+            if self.since is None or mtime > self.since or \
+                    (mtime == self.since and self._seen_before is not None and member_id not in self._seen_before):
+                yield rsvp
@@ -0,0 +1,104 @@
+""" Figures out which upcoming event a chat request is about """
+from typing import Dict, List, Optional
+
+try:
+    from rapidfuzz import fuzz, process
+    from rapidfuzz.utils import default_process as full_process
+
+    def _best_match(query: str, choices: List[str]) -> int:
+        return process.extractOne(query, choices, scorer=fuzz.WRatio, processor=None)[2]
+except ImportError:
+    from fuzzywuzzy import fuzz
+    from fuzzywuzzy.utils import full_process
+
+    def _best_match(query: str, choices: List[str]) -> int:
+        scores = [fuzz.WRatio(query, choice, full_process=False) for choice in choices]
+        return scores.index(max(scores))
+
+from dave.cache import TTLCache
+from dave.data_types import Event
+
+CHANNEL_FOR_VENUE = {"STORG Clubhouse": "#storg-south", "STORG Northern Clubhouse": "#storg-north"}
+
+
+class EventResolver(object):
+    def __init__(self, aliases: Dict[str, str] = None, channel_for_venue: Dict[str, str] = None,
+                 cache_size: int = 256) -> None:
+        """Resolves requests like "table status january" to the name of an upcoming event
+
+        :param aliases: (dict) Request -> venue name, e.g. {"south": "STORG Clubhouse"}
+        :param channel_for_venue: (dict) Venue name -> the channel (with a leading #) where that venue's events are discussed
+        :param cache_size: (int) How many resolved requests to remember
+        """
+        self.aliases = {full_process(alias): venue for alias, venue in (aliases or {}).items()}
+        self.venue_for_channel = {channel.lstrip("#"): venue
+                                  for venue, channel in (channel_for_venue or CHANNEL_FOR_VENUE).items()}
+        self._version = None
+        self._events = []
+        self._names = []
+        self._processed = []
+        self._exact = {}
+        self._resolved = TTLCache(ttl=24 * 3600, maxsize=cache_size)
+
+    def update(self, events: List[Event]) -> None:
+        """Prepares for matching against :events:. Nothing is recomputed if they haven't changed
+
+        :param events: (list) The upcoming events, sorted by time
+        """
+        version = tuple((e.event_id, e.name) for e in events)
+        if version == self._version:
+            return
+        self._version = version
+        self._events = list(events)
+        self._names = [e.name for e in events]
+        self._processed = [full_process(name) for name in self._names]
+        self._exact = {}
+        for processed, name in zip(self._processed, self._names):
+            self._exact.setdefault(processed, name)
+        self._resolved.clear()
+
+    @property
+    def cache_stats(self) -> dict:
+        """Hit and miss counters of the resolved requests"""
+        return self._resolved.stats
+
+    def _next_at(self, venue: str) -> Optional[str]:
+        for event in self._events:
+            if (event.venue or {}).get("name") == venue:
+                return event.name
+
+    def resolve(self, request: Optional[str], channel: str = None) -> Optional[str]:
+        """The name of the event :request: is about, trying exact names, aliases and the channel's venue
+        before fuzzy matching
+
+        :param request: (str) What was asked, e.g. "january event". Can be empty
+        :param channel: (str) The name of the channel it was asked in, without a leading #
+        :return: (str) The event name, or None if there are no events
+        """
+        key = (channel, request)
+        missing = object()
+        event_name = self._resolved.get(key, missing)
+        if event_name is missing:
+            event_name = self._resolve(request, channel)
+            self._resolved.set(key, event_name)
+        return event_name
+
+    def _resolve(self, request: Optional[str], channel: str = None) -> Optional[str]:
+        if not self._names:
+            return
+        query = full_process(request or "")
+        if query in self._exact:
+            return self._exact[query]
+        if query in self.aliases:
+            event_name = self._next_at(self.aliases[query])
+            if event_name:
+                return event_name
+        if channel and (not query or query == full_process(" ".join(channel.split("_")))):
+            venue = self.venue_for_channel.get(channel)
+            if venue:
+                event_name = self._next_at(venue)
+                if event_name:
+                    return event_name
+        if not query and channel:
+            query = full_process(" ".join(channel.split("_")))
+        return self._names[_best_match(query, self._processed)]
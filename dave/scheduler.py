@@ -0,0 +1,110 @@
+""" Decides which events to sync and when """
+import random
+from threading import Lock
+from time import time
+from typing import Callable, Dict, Iterable, List
+
+from dave.data_types import Event
+
+
+class _EventSchedule(object):
+    def __init__(self, due_at: float) -> None:
+        self.due_at = due_at
+        self.churn = 0.0
+        self.interval = None
+
+
+class SyncScheduler(object):
+    def __init__(self, min_interval: float = 60, max_interval: float = 4 * 3600, lead_fraction: float = 1 / 720,
+                 budget: int = 200, jitter: float = 0.2, churn_decay: float = 0.5,
+                 clock: Callable[[], float] = time, rand: Callable[[], float] = random.random) -> None:
+        """Gives every event its own polling interval. The interval shrinks as the event gets closer,
+        e.g. 2 minutes the day before and 1 hour a month before, and shrinks further while RSVPs keep changing.
+
+        :param min_interval: (float) Shortest interval in seconds
+        :param max_interval: (float) Longest interval in seconds
+        :param lead_fraction: (float) Interval as a fraction of the time left until the event
+        :param budget: (int) API calls a cycle may spend. The most overdue events go first
+        :param jitter: (float) Intervals are spread randomly by up to this fraction, so events don't synchronise
+        :param churn_decay: (float) How much of the RSVP churn seen so far counts at the next sync
+        :param clock: (callable) Returns the current Unix time in seconds
+        :param rand: (callable) Returns a random float in [0, 1)
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.lead_fraction = lead_fraction
+        self.budget = budget
+        self.jitter = jitter
+        self.churn_decay = churn_decay
+        self.cost_per_sync = 1.0
+        self._clock = clock
+        self._rand = rand
+        self._events = {}  # type: Dict[str, _EventSchedule]
+        self._lock = Lock()
+
+    def interval(self, event: Event, churn: float = 0.0) -> float:
+        """How often :event: should be synced, in seconds and without jitter
+
+        :param event: (Event) The event
+        :param churn: (float) How many RSVPs changed lately
+        """
+        time_left = max(0.0, event.time / 1000 - self._clock())
+        interval = time_left * self.lead_fraction / (1 + churn)
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def due(self, events: Iterable[Event]) -> List[Event]:
+        """The events to sync now, most overdue first, as many as the budget allows.
+        Events we haven't synced yet are due at once. Events that are no longer upcoming are forgotten.
+
+        :param events: (list) The upcoming events
+        """
+        now = self._clock()
+        with self._lock:
+            upcoming = {event.event_id: event for event in events}
+            for event_id in set(self._events) - set(upcoming):
+                del self._events[event_id]
+            for event_id in upcoming:
+                self._events.setdefault(event_id, _EventSchedule(due_at=now))
+
+            overdue = sorted((s.due_at, event_id) for event_id, s in self._events.items() if s.due_at <= now)
+            # Always sync at least one event, or a small budget could starve them all
+            affordable = max(1, int(self.budget // self.cost_per_sync))
+            return [upcoming[event_id] for _, event_id in overdue[:affordable]]
+
+    def synced(self, event: Event, changes: int = 0) -> float:
+        """Schedules the next sync of :event:
+
+        :param event: (Event) The event that was synced
+        :param changes: (int) How many RSVPs the sync found changed
+        :return: (float) Seconds until its next sync
+        """
+        with self._lock:
+            schedule = self._events.setdefault(event.event_id, _EventSchedule(due_at=0))
+            schedule.churn = schedule.churn * self.churn_decay + changes
+            interval = self.interval(event, schedule.churn)
+            interval *= 1 + self.jitter * (2 * self._rand() - 1)
+            schedule.interval = interval
+            schedule.due_at = self._clock() + interval
+            return interval
+
+    def spent(self, calls: float, syncs: int) -> None:
+        """Learns what a sync costs from what the last cycle spent
+
+        :param calls: (float) API calls made during the cycle
+        :param syncs: (int) Events synced during the cycle
+        """
+        if syncs:
+            with self._lock:
+                self.cost_per_sync = max(1.0, (self.cost_per_sync + calls / syncs) / 2)
+
+    def sleep_time(self, longest: float) -> float:
+        """Seconds until the next event is due, but no more than :longest:.
+        Events still overdue after a cycle failed or ran out of budget wait for the shortest interval,
+        so that a failing Meetup or a long backlog doesn't make us poll in a tight loop.
+        """
+        with self._lock:
+            if not self._events:
+                return longest
+            next_due = min(s.due_at for s in self._events.values())
+        wait = next_due - self._clock()
+        return min(longest, wait if wait > 0 else self.min_interval)
@@ -1,10 +1,88 @@
+import random
+from collections import OrderedDict
 from os import environ
-from time import sleep
+from select import select
+from threading import Condition, RLock, Thread
+from time import monotonic, sleep
+from typing import Optional
+
 from slackclient import SlackClient
 
+from dave import metrics
 from dave.log import logger
 
 
+class InstrumentedSlackClient(SlackClient):
+    """A SlackClient that records every Web API call in the metrics"""
+
+    def api_call(self, method, timeout=None, **kwargs):
+        started = monotonic()
+        status = "error"
+        try:
+            response = super().api_call(method, timeout=timeout, **kwargs)
+            status = "ok" if response.get("ok") else response.get("error", "error")
+            return response
+        except Exception as e:
+            status = type(e).__name__
+            raise
+        finally:
+            metrics.observe_api("slack", method, status, monotonic() - started, method="POST")
+
+
+class ChannelDirectory(object):
+    def __init__(self, max_age=600):
+        """The channels we know about, by id. Kept current from RTM events once primed from rtm.start,
+        otherwise filled in one channel at a time and refreshed after :max_age: seconds
+
+        :param max_age: (int) Seconds after which a channel not kept current by RTM is looked up again
+        """
+        self.max_age = max_age
+        self.live = False
+        self._channels = {}
+        self._lock = RLock()
+
+    def prime(self, channels):
+        """Replaces the directory with :channels:, e.g. the "channels" of an rtm.start response
+
+        :param channels: (list) Channel objects (dicts)
+        """
+        with self._lock:
+            self._channels = {c["id"]: (monotonic(), c) for c in channels}
+            self.live = True
+
+    def put(self, channel):
+        with self._lock:
+            self._channels[channel["id"]] = (monotonic(), channel)
+
+    def get(self, channel_id) -> Optional[dict]:
+        """The channel object for :channel_id:, or None if it's unknown or too old to trust"""
+        entry = self._channels.get(channel_id)
+        if entry and (self.live or monotonic() - entry[0] < self.max_age):
+            return entry[1]
+
+    def handle_event(self, event):
+        """Applies a channel related RTM event
+
+        :param event: (dict) Any RTM event. The ones not about channels are ignored
+        """
+        event_type = event.get("type")
+        with self._lock:
+            if event_type in ("channel_created", "channel_rename"):
+                known = self.get(event["channel"]["id"]) or {}
+                self.put(dict(known, **event["channel"]))
+            elif event_type in ("channel_archive", "channel_unarchive"):
+                known = self.get(event["channel"])
+                if known:
+                    self.put(dict(known, is_archived=event_type == "channel_archive"))
+            elif event_type == "channel_deleted":
+                self._channels.pop(event["channel"], None)
+            elif event_type == "message" and event.get("subtype") == "channel_topic":
+                known = self.get(event["channel"])
+                if known:
+                    topic = dict(known.get("topic") or {}, value=event.get("topic", ""))
+                    self.put(dict(known, topic=topic))
+
+
 class Slack(object):
     def __init__(self, slack_token, bot_id):
         """Creates a Slack connection object
@@ -12,17 +90,31 @@ class Slack(object):
         :param slack_token: (str) Your Slack API key
         :param bot_id: (str) The bot's user id
         """
-        self.sc = SlackClient(slack_token)
+        self.sc = InstrumentedSlackClient(slack_token)
+        self.channels = ChannelDirectory()
+        self._ims = set()
         self.at_bot = "<@" + bot_id + ">"
         self.bot_id = bot_id
 
-    @property
-    def _channels(self):
-        """Gets all channels
+    def _channel(self, channel_id) -> Optional[dict]:
+        """Gets a channel from the directory, asking Slack for it if it's not there
 
-        :return: (list) List of channel objects (dicts)
+        :param channel_id: (str)
+        :return: (dict) The channel object, or None if Slack doesn't know it
         """
-        return self.sc.api_call("channels.list")["channels"]
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self._fetch_channel(channel_id)
+        return channel
+
+    def _fetch_channel(self, channel_id) -> Optional[dict]:
+        info = self.sc.api_call("channels.info", channel=channel_id)
+        if not info["ok"]:
+            logger.debug("Couldn't look up channel {}: {}".format(channel_id, info.get("error")))
+            return
+        channel = info["channel"]
+        self.channels.put(channel)
+        return channel
 
     def channel_name(self, channel_id):
         """Get the name of the channel with id :channel_:
@@ -30,16 +122,22 @@ class Slack(object):
         :param channel_id: (str)
         :return: (str) The channel name
         """
-        for channel in self._channels:
-            if channel["id"] == channel_id:
-                return channel["name"]
+        channel = self._channel(channel_id)
+        if channel:
+            return channel["name"]
 
     def channel_topic(self, channel_id):
-        info = self.sc.api_call("channels.info", channel=channel_id)
-        if info["ok"]:
-            return info["channel"]["topic"]["value"]
+        """Get the topic of the channel with id :channel_id:. Slack is asked every time unless RTM keeps
+        the directory current in this process, since a topic that changed could point at another board
+
+        :param channel_id: (str)
+        :return: (str) The channel topic
+        """
+        channel = self._channel(channel_id) if self.channels.live else self._fetch_channel(channel_id)
+        if channel:
+            return channel["topic"]["value"]
         else:
-            logger.critical("{}".format(info))
+            logger.critical("Channel {} not found".format(channel_id))
             raise ValueError
 
     def message(self, content, channel, attachments=None, ts=None):
@@ -82,34 +180,51 @@ class Slack(object):
         )
 
     def _is_im(self, channel_id):
-        ims = self.sc.api_call("im.list")["ims"]
-        ids = [i["id"] for i in ims]
-        return channel_id in ids
+        """Whether :channel_id: is a direct message channel. Decided from the id's prefix
+        (C: channel, G: private channel or group DM, D: DM) and only asks Slack for ids it can't classify
+        """
+        if channel_id in self._ims:
+            return True
+        if channel_id.startswith(("C", "G")):
+            return False
+        if channel_id.startswith("D"):
+            self._ims.add(channel_id)
+            return True
+        ims = self.sc.api_call("im.list").get("ims", [])
+        self._ims.update(i["id"] for i in ims)
+        return channel_id in self._ims
+
+    def _track_ims(self, event):
+        """Remembers the DM channels announced by im_created and im_open RTM events"""
+        if event.get("type") == "im_created":
+            self._ims.add(event["channel"]["id"])
+        elif event.get("type") == "im_open":
+            self._ims.add(event["channel"])
 
     # TODO: return the calling user id as well
     def _parse_slack_output(self, slack_rtm_output):
         """Parse the :slack_rtm_output: received from Slack and return everything after the bot's @-name
-        or None if it wasn't directed at the bot.
-
-        :param slack_rtm_output: (str) Slack message to parse
-        :return: (tuple) A tuple of the striped message and channel id
-        """
-        output_list = slack_rtm_output
-        if output_list and len(output_list) > 0:
-            for output in output_list:
-                if output and 'text' in output and self.at_bot in output['text'] and output["user"] != 'USLACKBOT' and output["ts"]:
-                    # return text excluding the @ mention, whitespace removed
-                    logger.debug(output)
-                    command = ' '.join([t.strip() for t in output["text"].split(self.at_bot) if t])
-                    return command, output["channel"], output["user"], output["ts"]
-                elif output and "channel" in output and "text" in output \
-                        and self._is_im(output["channel"]) and output["user"] != self.bot_id and \
-                        output["user"] != 'USLACKBOT' and output["ts"]:
-                    logger.debug(output)
-                    return output["text"], output["channel"], output["user"], output["ts"]
-                else:
-                    logger.debug(output)
-        return None, None, None, None
+        for every message that was directed at the bot.
+
+        :param slack_rtm_output: (list) Slack events to parse
+        :return: (list) A tuple of the striped message, channel id, user id and timestamp per command
+        """
+        commands = []
+        for output in slack_rtm_output or []:
+            if output and 'text' in output and self.at_bot in output['text'] \
+                    and output.get("user") != 'USLACKBOT' and output.get("ts"):
+                # return text excluding the @ mention, whitespace removed
+                logger.debug(output)
+                command = ' '.join([t.strip() for t in output["text"].split(self.at_bot) if t])
+                commands.append((command, output["channel"], output.get("user"), output["ts"]))
+            elif output and "channel" in output and "text" in output \
+                    and self._is_im(output["channel"]) and output.get("user") != self.bot_id and \
+                    output.get("user") != 'USLACKBOT' and output.get("ts"):
+                logger.debug(output)
+                commands.append((output["text"], output["channel"], output.get("user"), output["ts"]))
+            else:
+                logger.debug(output)
+        return commands
 
     def new_event(self, event_name, date, venue, url, channel="#announcements"):
         """
@@ -144,23 +259,85 @@ class Slack(object):
             text = "{} joined the waitlist for the {}\n{} in the waitlist".format(names, event_name, waitlist)
         self.send_attachment(title="New RSVP", message=text, colour=colour, channel=channel)
 
-    def rtm(self, queue, read_delay=1):
+    def _rtm_connect(self):
+        if not self.sc.rtm_connect():
+            return False
+        logger.info("Slack RTM connected")
+        login_data = getattr(self.sc.server, "login_data", None) or {}
+        if "channels" in login_data:
+            self.channels.prime(login_data["channels"])
+        self._ims.update(i["id"] for i in login_data.get("ims", []))
+        return True
+
+    def _dispatch(self, events, queue):
+        for event in events:
+            self.channels.handle_event(event)
+            self._track_ims(event)
+        for command, channel, user_id, thread in self._parse_slack_output(events):
+            if command and channel and user_id and thread:
+                logger.debug("Command found; text: {}, channel: {}, user_id: {}, thread: {}".format(
+                    command, channel, user_id, thread))
+                queue.put((command, channel, user_id, thread))
+
+    def _rtm_listen(self, queue, ping_interval):
+        """Blocks on the RTM websocket and dispatches events as soon as they arrive.
+        Pings Slack after :ping_interval: seconds of silence and gives up if nothing comes back either.
+        """
+        last_seen = monotonic()
+        pinged = False
+        while True:
+            readable, _, _ = select([self.sc.server.websocket.sock], [], [], ping_interval)
+            if readable:
+                # Each read takes one frame off the socket. The rest of a burst can already sit in the SSL buffer,
+                # where select doesn't see it, so we keep reading until there's nothing left
+                events = self.sc.rtm_read()
+                while events:
+                    last_seen = monotonic()
+                    pinged = False
+                    self._dispatch(events, queue)
+                    events = self.sc.rtm_read()
+
+            silence = monotonic() - last_seen
+            if silence >= 2 * ping_interval:
+                raise ConnectionError("No answer from Slack RTM for {:.0f}s".format(silence))
+            if silence >= ping_interval and not pinged:
+                self.sc.server.ping()
+                pinged = True
+
+    def rtm(self, queue, ping_interval=30, max_backoff=300):
         """Creates a Real Time Messaging connection to Slack and listens for events
         https://api.slack.com/rtm
 
         :param queue: (queue) A Multiprocess Queue where it'll put the incoming events
-        :param read_delay: (int) How often to check for events. Default: 1s
+        :param ping_interval: (int) Seconds of silence after which we ping Slack to check the connection
+        :param max_backoff: (int) Longest wait in seconds between two reconnection attempts
         :return: None
         """
-        if self.sc.rtm_connect():
-            logger.info("Slack RTM connected")
-            self.message("Reporting for duty!", environ.get("LAB_CHANNEL_ID"))
-            while True:
-                command, channel, user_id, thread = self._parse_slack_output(self.sc.rtm_read())
-                if command and channel and user_id and thread:
-                    logger.debug("Command found; text: {}, channel: {}, user_id: {}, thread: {}".format(command, channel, user_id, thread))
-                    queue.put((command, channel, user_id, thread))
-                sleep(read_delay)
+        backoff = 1
+        greeted = False
+        while True:
+            try:
+                connected = self._rtm_connect()
+            except Exception as e:
+                logger.warning("Slack RTM connection failed: {}".format(e))
+                connected = False
+
+            if not connected:
+                delay = random.uniform(backoff / 2, backoff)
+                logger.info("Reconnecting to Slack RTM in {:.1f}s".format(delay))
+                metrics.API_SLEEP.inc(delay, api="slack", reason="reconnect")
+                sleep(delay)
+                backoff = min(backoff * 2, max_backoff)
+                continue
+
+            backoff = 1
+            if not greeted:
+                self.message("Reporting for duty!", environ.get("LAB_CHANNEL_ID"))
+                greeted = True
+            try:
+                self._rtm_listen(queue, ping_interval)
+            except Exception as e:
+                logger.warning("Slack RTM connection lost: {}".format(e))
 
     def userid_info(self, user_id):
         logger.debug("Looking for user {}".format(user_id))
@@ -173,3 +350,120 @@ class Slack(object):
             return info["user"]
         else:
             logger.warn(info["error"])
+
+
+class RsvpAnnouncement(object):
+    """ The RSVP changes of one event waiting to be announced together """
+    def __init__(self, event_name):
+        self.event_name = event_name
+        self.joined = []
+        self.canceled = []
+        self.waitlisted = []
+        self.spots = None
+        self.waitlist = 0
+
+    @property
+    def colour(self):
+        if self.canceled and not self.joined:
+            return "b20000"
+        return "#36a64f" if self.joined else "#808080"
+
+    @property
+    def text(self):
+        lines = []
+        if self.joined:
+            lines.append("{} replied yes for the {}".format(', '.join(self.joined), self.event_name))
+        if self.canceled:
+            lines.append("{} replied no for the {}".format(', '.join(self.canceled), self.event_name))
+        if self.waitlisted:
+            lines.append("{} joined the waitlist for the {}".format(', '.join(self.waitlisted), self.event_name))
+        lines.append("{} spots left".format(self.spots))
+        if self.waitlist:
+            lines.append("{} in the waiting list".format(self.waitlist))
+        return '\n'.join(lines)
+
+
+class Announcer(object):
+    def __init__(self, slack, flush_after=2.0, channel_interval=1.0):
+        """Queues RSVP announcements and posts them from a background thread, so syncing never waits for Slack.
+        Changes to the same event that arrive within :flush_after: seconds go out as a single message,
+        and no channel gets more than one message per :channel_interval: seconds.
+
+        :param slack: (Slack) Used to post the messages
+        :param flush_after: (float) Seconds to wait for more changes before posting
+        :param channel_interval: (float) Minimum seconds between two messages to the same channel
+        """
+        self.slack = slack
+        self.flush_after = flush_after
+        self.channel_interval = channel_interval
+        self._pending = OrderedDict()
+        self._last_sent = {}
+        self._condition = Condition()
+        self._thread = None
+
+    def rsvps(self, channel, event_name, joined=(), canceled=(), waitlisted=(), spots=None, waitlist=0):
+        """Queues the RSVP changes of an event for :channel:
+
+        :param channel: The channel where to make the announcement. Needs a leading #
+        :param event_name: The event's title
+        :param joined: Names of the ones that replied yes
+        :param canceled: Names of the ones that replied no
+        :param waitlisted: Names of the ones that joined the waitlist
+        :param spots: The number of spots left
+        :param waitlist: Number of people on the waiting list
+        """
+        if not channel:
+            logger.debug("No channel to announce RSVPs for {} in".format(event_name))
+            return
+        with self._condition:
+            key = (channel, event_name)
+            if key not in self._pending:
+                self._pending[key] = (monotonic(), RsvpAnnouncement(event_name))
+            announcement = self._pending[key][1]
+            announcement.joined.extend(joined)
+            announcement.canceled.extend(canceled)
+            announcement.waitlisted.extend(waitlisted)
+            announcement.spots = spots
+            announcement.waitlist = waitlist
+            self._condition.notify()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run, name="announcer", daemon=True)
+                self._thread.start()
+
+    def _next_due(self):
+        """The pending announcement that can go out first and when"""
+        best = None
+        for (channel, event_name), (queued_at, _) in self._pending.items():
+            due = max(queued_at + self.flush_after, self._last_sent.get(channel, -self.channel_interval) +
+                      self.channel_interval)
+            if best is None or due < best[1]:
+                best = ((channel, event_name), due)
+        return best
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                key, due = self._next_due()
+                wait = due - monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                _, announcement = self._pending.pop(key)
+                self._last_sent[key[0]] = monotonic()
+            self._send(key[0], announcement)
+
+    def _send(self, channel, announcement):
+        try:
+            self.slack.send_attachment(title="New RSVP", message=announcement.text, colour=announcement.colour,
+                                       channel=channel)
+        except Exception as e:
+            logger.error("Couldn't announce RSVPs for {}: {}".format(announcement.event_name, e))
+
+    def flush(self):
+        """Posts everything that's pending right away"""
+        with self._condition:
+            pending, self._pending = self._pending, OrderedDict()
+        for (channel, _), (_, announcement) in pending.items():
+            self._send(channel, announcement)
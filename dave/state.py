@@ -0,0 +1,285 @@
+""" What the bot remembers between sync cycles, stored in Postgres or in a local SQLite file """
+import json
+import sqlite3
+from os import environ, getpid
+from threading import RLock
+from time import time
+from typing import List, Optional
+
+from dave.data_types import Event, Member
+
+
+class Database(object):
+    def __init__(self, url: str = None) -> None:
+        """A connection to Postgres, or to SQLite when no Postgres URL is given.
+        Connections are opened lazily and reopened after a fork, so a Database can be shared with child processes.
+
+        :param url: (str) postgres://... or sqlite:///<path>. Defaults to $DATABASE_URL, then to sqlite:///dave.sqlite3
+        """
+        self.url = url or environ.get("DATABASE_URL") or "sqlite:///dave.sqlite3"
+        self._conn = None
+        self._pid = None
+        self._lock = RLock()
+
+    @property
+    def is_postgres(self) -> bool:
+        return self.url.startswith(("postgres://", "postgresql://"))
+
+    def _connect(self):
+        if self.is_postgres:
+            import psycopg2
+            return psycopg2.connect(self.url)
+        path = self.url[len("sqlite:///"):] if self.url.startswith("sqlite:///") else self.url
+        return sqlite3.connect(path or ":memory:", check_same_thread=False)
+
+    def _cursor(self):
+        if self._conn is None or self._pid != getpid():
+            self._conn = self._connect()
+            self._pid = getpid()
+        return self._conn.cursor()
+
+    def _sql(self, sql: str) -> str:
+        """Queries are written with SQLite's ? placeholders"""
+        return sql.replace("?", "%s") if self.is_postgres else sql
+
+    def execute(self, sql: str, params: tuple = ()) -> List[tuple]:
+        """Runs :sql: in its own transaction
+
+        :return: (list) The rows returned, if any
+        """
+        with self._lock:
+            cursor = self._cursor()
+            try:
+                cursor.execute(self._sql(sql), params)
+                rows = cursor.fetchall() if cursor.description else []
+                self._conn.commit()
+                return rows
+            except Exception:
+                self._conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def upsert(self, table: str, keys: dict, values: dict) -> None:
+        """Updates the row of :table: matching :keys: with :values:, inserting it if it doesn't exist"""
+        assignments = ", ".join("{} = ?".format(column) for column in values)
+        conditions = " AND ".join("{} = ?".format(column) for column in keys)
+        row = dict(keys, **values)
+        with self._lock:
+            cursor = self._cursor()
+            try:
+                cursor.execute(self._sql("UPDATE {} SET {} WHERE {}".format(table, assignments, conditions)),
+                               tuple(values.values()) + tuple(keys.values()))
+                if cursor.rowcount == 0:
+                    cursor.execute(self._sql("INSERT INTO {} ({}) VALUES ({})".format(
+                        table, ", ".join(row), ", ".join("?" for _ in row))), tuple(row.values()))
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+
+class EventState(object):
+    """ What an event looked like the last time its RSVPs were synced """
+    def __init__(self, event_id: str, yes_rsvp_count: int = None, waitlist_count: int = None, updated: int = None,
+                 watermark: int = None) -> None:
+        self.event_id = str(event_id)
+        self.yes_rsvp_count = yes_rsvp_count
+        self.waitlist_count = waitlist_count
+        self.updated = updated
+        self.watermark = watermark
+
+    def unchanged(self, event: Event) -> bool:
+        """Whether :event: still has the counters and last update time we saw"""
+        return (self.yes_rsvp_count, self.waitlist_count, self.updated) == \
+            (event.yes_rsvp_count, event.waitlist_count, event.updated) and self.updated is not None
+
+    def __repr__(self):
+        return "EventState(event_id={self.event_id}, yes_rsvp_count={self.yes_rsvp_count}, " \
+               "waitlist_count={self.waitlist_count}, updated={self.updated}, " \
+               "watermark={self.watermark})".format_map(vars())
+
+
+class SyncState(object):
+    def __init__(self, db: Database) -> None:
+        """The per-event sync state
+
+        :param db: (Database) Where to keep it
+        """
+        self.db = db
+        self._ready = False
+
+    def _create_table(self) -> None:
+        if not self._ready:
+            self.db.execute("CREATE TABLE IF NOT EXISTS event_sync ("
+                            "event_id TEXT PRIMARY KEY, yes_rsvp_count INTEGER, waitlist_count INTEGER, "
+                            "updated BIGINT, watermark BIGINT)")
+            self._ready = True
+
+    def get(self, event_id: str) -> Optional[EventState]:
+        self._create_table()
+        rows = self.db.execute("SELECT event_id, yes_rsvp_count, waitlist_count, updated, watermark "
+                               "FROM event_sync WHERE event_id = ?", (str(event_id),))
+        if rows:
+            return EventState(*rows[0])
+
+    def save(self, state: EventState) -> None:
+        self._create_table()
+        self.db.upsert("event_sync", {"event_id": state.event_id},
+                       {"yes_rsvp_count": state.yes_rsvp_count, "waitlist_count": state.waitlist_count,
+                        "updated": state.updated, "watermark": state.watermark})
+
+
+class SnapshotStore(object):
+    def __init__(self, db: Database) -> None:
+        """Board snapshots shared between processes, in the shape GET /boards/{id} returns them with
+        lists, cards and labels nested. Each snapshot remembers when it was last confirmed to be current.
+
+        :param db: (Database) Where to keep them
+        """
+        self.db = db
+        self._ready = False
+
+    def _create_table(self) -> None:
+        if not self._ready:
+            self.db.execute("CREATE TABLE IF NOT EXISTS board_snapshots ("
+                            "board_id TEXT PRIMARY KEY, payload TEXT, updated_at DOUBLE PRECISION, "
+                            "checked_at DOUBLE PRECISION)")
+            self._ready = True
+
+    def get(self, board_id: str, max_age: float = None) -> Optional[dict]:
+        """The stored snapshot of a board
+
+        :param board_id: (str) The board's id
+        :param max_age: (float) Ignore snapshots not confirmed current in the last :max_age: seconds
+        :return: (dict) The board, or None
+        """
+        self._create_table()
+        rows = self.db.execute("SELECT payload, checked_at FROM board_snapshots WHERE board_id = ?", (board_id,))
+        if not rows:
+            return
+        payload, checked_at = rows[0]
+        if max_age is not None and time() - checked_at > max_age:
+            return
+        return json.loads(payload)
+
+    def put(self, board_id: str, board: dict) -> None:
+        self._create_table()
+        now = time()
+        self.db.upsert("board_snapshots", {"board_id": board_id},
+                       {"payload": json.dumps(board), "updated_at": now, "checked_at": now})
+
+    def touch(self, board_id: str) -> None:
+        """Confirms the stored snapshot of a board is still current"""
+        self._create_table()
+        self.db.execute("UPDATE board_snapshots SET checked_at = ? WHERE board_id = ?", (time(), board_id))
+
+    def discard(self, board_id: str) -> None:
+        self._create_table()
+        self.db.execute("DELETE FROM board_snapshots WHERE board_id = ?", (board_id,))
+
+
+class EventStore(object):
+    def __init__(self, db: Database) -> None:
+        """The upcoming events of a group, as last seen by the monitor, so that other processes don't have to ask Meetup
+
+        :param db: (Database) Where to keep them
+        """
+        self.db = db
+        self._ready = False
+
+    def _create_table(self) -> None:
+        if not self._ready:
+            self.db.execute("CREATE TABLE IF NOT EXISTS published_events ("
+                            "group_id TEXT PRIMARY KEY, payload TEXT, updated_at DOUBLE PRECISION)")
+            self._ready = True
+
+    def get(self, group_id: str, max_age: float = None) -> Optional[List[Event]]:
+        """The published upcoming events of a group
+
+        :param group_id: (str) The Meetup group
+        :param max_age: (float) Ignore events published more than :max_age: seconds ago
+        :return: (list) The events sorted by time, or None
+        """
+        self._create_table()
+        rows = self.db.execute("SELECT payload, updated_at FROM published_events WHERE group_id = ?",
+                               (str(group_id),))
+        if not rows:
+            return
+        payload, updated_at = rows[0]
+        if max_age is not None and time() - updated_at > max_age:
+            return
+        return [Event(**e) for e in json.loads(payload)]
+
+    def put(self, group_id: str, events: List[Event]) -> None:
+        self._create_table()
+        payload = [{"id": e.event_id, "name": e.name, "time": e.time, "status": e.status, "rsvp_limit": e.rsvp_limit,
+                    "waitlist_count": e.waitlist_count, "yes_rsvp_count": e.yes_rsvp_count, "announced": e.announced,
+                    "event_url": e.event_url, "venue": e.venue, "updated": e.updated} for e in events]
+        self.db.upsert("published_events", {"group_id": str(group_id)},
+                       {"payload": json.dumps(payload), "updated_at": time()})
+
+
+class MemberStore(object):
+    def __init__(self, db: Database) -> None:
+        """Who our members are on Meetup, Slack and Sverok, and which Trello card stands for them on each event board
+
+        :param db: (Database) Where to keep them
+        """
+        self.db = db
+        self._ready = False
+
+    def _create_tables(self) -> None:
+        if not self._ready:
+            self.db.execute("CREATE TABLE IF NOT EXISTS members ("
+                            "meetup_id BIGINT PRIMARY KEY, name TEXT, slack_id TEXT, sverok_id TEXT, group_id TEXT)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS members_slack_id ON members (slack_id)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS member_cards ("
+                            "meetup_id BIGINT, board_id TEXT, card_id TEXT, PRIMARY KEY (meetup_id, board_id))")
+            self._ready = True
+
+    def _member(self, column: str, value) -> Optional[Member]:
+        self._create_tables()
+        rows = self.db.execute("SELECT name, meetup_id, slack_id, sverok_id, group_id FROM members "
+                               "WHERE {} = ?".format(column), (value,))
+        if rows:
+            return Member(*rows[0])
+
+    def get(self, meetup_id: int) -> Optional[Member]:
+        return self._member("meetup_id", int(meetup_id))
+
+    def by_slack_id(self, slack_id: str) -> Optional[Member]:
+        return self._member("slack_id", slack_id)
+
+    def save(self, member: Member) -> None:
+        """Stores :member:, keeping the ids we already know when :member: doesn't have them"""
+        known = self.get(member.meetup_id)
+        if known:
+            member = Member(name=member.name or known.name, meetup_id=member.meetup_id,
+                            slack_id=member.slack_id or known.slack_id, sverok_id=member.sverok_id or known.sverok_id,
+                            group_id=member.group_id or known.group_id)
+        self.db.upsert("members", {"meetup_id": int(member.meetup_id)},
+                       {"name": member.name, "slack_id": member.slack_id, "sverok_id": member.sverok_id,
+                        "group_id": member.group_id})
+
+    def link_slack(self, meetup_id: int, slack_id: str) -> None:
+        """Links a Meetup member to a Slack user, e.g. to know who is writing in a DM"""
+        self.save(Member(name=None, meetup_id=meetup_id, slack_id=slack_id))
+
+    def card_id(self, meetup_id: int, board_id: str) -> Optional[str]:
+        """The id of the card standing for a member on an event board"""
+        self._create_tables()
+        rows = self.db.execute("SELECT card_id FROM member_cards WHERE meetup_id = ? AND board_id = ?",
+                               (int(meetup_id), board_id))
+        if rows:
+            return rows[0][0]
+
+    def save_card(self, meetup_id: int, board_id: str, card_id: str) -> None:
+        self._create_tables()
+        self.db.upsert("member_cards", {"meetup_id": int(meetup_id), "board_id": board_id}, {"card_id": card_id})
+
+    def forget_card(self, meetup_id: int, board_id: str) -> None:
+        self._create_tables()
+        self.db.execute("DELETE FROM member_cards WHERE meetup_id = ? AND board_id = ?", (int(meetup_id), board_id))
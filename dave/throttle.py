@@ -0,0 +1,56 @@
+""" Client-side rate limiting """
+from collections import deque
+from threading import Lock
+from time import monotonic, sleep
+from typing import Callable
+
+
+class SlidingWindow(object):
+    def __init__(self, limit: int, window: float, clock: Callable[[], float] = monotonic,
+                 sleeper: Callable[[float], None] = sleep) -> None:
+        """Lets through at most :limit: calls in any :window: seconds, the way Trello counts its rate limits.
+        Callers that would go over reserve the first free slot anyway and wait for it, so they're served in order.
+
+        :param limit: (int) Calls allowed per window
+        :param window: (float) Length of the window in seconds
+        :param clock: (callable) Returns the current time in seconds
+        :param sleeper: (callable) Waits the given number of seconds
+        """
+        self.limit = max(1, int(limit))
+        self.window = window
+        self.consumed = 0
+        self.waited = 0.0
+        self._clock = clock
+        self._sleep = sleeper
+        # When each of the last :limit: calls was, or will be, let through
+        self._slots = deque()
+        self._paused_until = 0.0
+        self._lock = Lock()
+
+    def acquire(self) -> float:
+        """Waits until one more call fits in the window
+
+        :return: (float) Seconds waited
+        """
+        with self._lock:
+            now = self._clock()
+            at = max(now, self._paused_until)
+            if len(self._slots) >= self.limit:
+                at = max(at, self._slots.popleft() + self.window)
+            self._slots.append(at)
+            wait = at - now
+            self.consumed += 1
+            self.waited += wait
+        if wait:
+            self._sleep(wait)
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """Holds every caller back for :seconds:, e.g. after the server said we went too fast"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    @property
+    def stats(self) -> dict:
+        """Calls let through and seconds spent waiting for them"""
+        return {"consumed": self.consumed, "waited_seconds": self.waited}
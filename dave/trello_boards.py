@@ -1,91 +1,284 @@
-from collections import OrderedDict
-from functools import lru_cache
-from time import sleep
-from typing import List, Optional, Dict
+import random
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+from threading import BoundedSemaphore, RLock
+from time import monotonic
+from typing import Callable, List, Optional, Dict, Tuple
 
-from trello import TrelloClient, Card, Board
+from trello import TrelloClient
+from trello.exceptions import ResourceUnavailable
 
-from dave.data_types import GameTable
+from dave import metrics
+from dave.cache import TTLCache
+from dave.data_types import GameTable, Member
 from dave.exceptions import NoBoardError
 from dave.log import logger
+from dave.throttle import SlidingWindow
+
+
+class ThrottledTrelloClient(TrelloClient):
+    def __init__(self, *args, max_concurrency=4, token_rate=10.0, key_rate=30.0, window=10.0, retries=3, backoff=1.0,
+                 **kwargs):
+        """A TrelloClient that paces its calls to Trello's rate limits of 100 requests per 10s per token
+        and 300 per 10s per key, and backs off when Trello answers 429 anyway.
+        The limits are per process. Processes sharing a token and key have to split them, see share()
+
+        :param max_concurrency: (int) Maximum number of calls in flight at the same time
+        :param token_rate: (float) Requests per second allowed for our token, averaged over :window:
+        :param key_rate: (float) Requests per second allowed for our API key, averaged over :window:
+        :param window: (float) Seconds over which Trello counts the requests
+        :param retries: (int) How many times to retry a call Trello turned down with 429
+        :param backoff: (float) Base delay in seconds before retrying. Doubles with every retry
+        """
+        super().__init__(*args, **kwargs)
+        self._slots = BoundedSemaphore(max_concurrency)
+        self.rates = {"token": token_rate, "key": key_rate}
+        self.window = window
+        self.limits = {}
+        self.share(1)
+        self.retries = retries
+        self.backoff = backoff
+
+    def share(self, fraction: float) -> None:
+        """Limits this process to :fraction: of the rates, when other processes use the same token and key
+
+        :param fraction: (float) e.g. 0.5 for half
+        """
+        self.limits = {name: SlidingWindow(limit=rate * self.window * fraction, window=self.window)
+                       for name, rate in self.rates.items()}
+
+    def fetch_json(self, uri_path, http_method="GET", *args, **kwargs):
+        for attempt in range(self.retries + 1):
+            for limit in self.limits.values():
+                limit.acquire()
+            started = monotonic()
+            status = 200
+            try:
+                with self._slots:
+                    return super().fetch_json(uri_path, http_method, *args, **kwargs)
+            except ResourceUnavailable as e:
+                status = getattr(e, "_status", None)
+                if status != 429 or attempt == self.retries:
+                    raise
+                delay = random.uniform(self.backoff, 2 * self.backoff) * 2 ** attempt
+                logger.warning("Trello rate limit hit, backing off for {:.1f}s".format(delay))
+                for limit in self.limits.values():
+                    limit.pause(delay)
+            except Exception as e:
+                status = type(e).__name__
+                raise
+            finally:
+                metrics.observe_api("trello", "/" + uri_path.lstrip("/"), status, monotonic() - started,
+                                    method=http_method)
+
+    @property
+    def throttle_stats(self) -> dict:
+        """Tokens consumed and time spent waiting for them, per rate limit"""
+        return {name: limit.stats for name, limit in self.limits.items()}
 
 
 class TrelloBoard(object):
-    def __init__(self, api_key, token):
+    def __init__(self, api_key, token, team_name=None, cache_ttl=300, snapshot_ttl=60, max_concurrency=4,
+                 snapshot_store=None, store_max_age=900, token_rate=10.0, key_rate=30.0, member_store=None):
         """Creates a TrelloBoard object
 
         :param api_key: (str) Your Trello api key https://trello.com/1/appKey/generate
         :param token:  (str) Your Trello token
+        :param team_name: (str) The Trello team whose boards we look at. All boards we can access if None
+        :param cache_ttl: (int) Seconds to remember board and team lookups
+        :param snapshot_ttl: (int) Seconds to remember the contents of a board. Our own writes refresh it earlier
+        :param max_concurrency: (int) Maximum number of Trello calls in flight at the same time
+        :param snapshot_store: (SnapshotStore) Board snapshots kept current by webhooks, read before polling Trello
+        :param store_max_age: (int) Seconds after which a stored snapshot that wasn't confirmed current is ignored
+        :param token_rate: (float) Trello requests per second this process may make with our token
+        :param key_rate: (float) Trello requests per second this process may make with our API key
+        :param member_store: (MemberStore) Remembers the card of each member on each board, so we don't have to look
+        """
+        self.tc = ThrottledTrelloClient(api_key=api_key, token=token, max_concurrency=max_concurrency,
+                                        token_rate=token_rate, key_rate=key_rate)
+        self._lookups = TTLCache(ttl=cache_ttl)
+        self._snapshots = TTLCache(ttl=snapshot_ttl)
+        self._invalidation_hooks = []
+        self.snapshot_store = snapshot_store
+        self.member_store = member_store
+        self.store_max_age = store_max_age
+        self.team_name = team_name
+        self._board_index = None
+        self._index_lock = RLock()
+
+    @property
+    def cache_stats(self) -> dict:
+        """Hit and miss counters of the board lookup and board snapshot caches"""
+        return {"lookups": self._lookups.stats, "snapshots": self._snapshots.stats}
+
+    def add_invalidation_hook(self, hook: Callable[[str], None]) -> None:
+        """Registers :hook: to be called with the board id whenever we change a board
+
+        :param hook: (callable) Takes the id of the board that changed
         """
-        self.tc = TrelloClient(api_key=api_key, token=token)
+        self._invalidation_hooks.append(hook)
+
+    def invalidate(self, board_id: str = None) -> None:
+        """Forgets what we know about a board, or about every board if :board_id: is None"""
+        logger.debug("Invalidating cached data for board {}".format(board_id or "*"))
+        if board_id:
+            self._snapshots.invalidate(board_id)
+            if self.snapshot_store:
+                # The webhook for our change or the next publish stores it again
+                self.snapshot_store.discard(board_id)
+        else:
+            self._snapshots.clear()
+            self._lookups.clear()
+            self._board_index = None
+        for hook in self._invalidation_hooks:
+            hook(board_id)
+
+    def _wrote(self, board_id: str, change: Callable[["BoardSnapshot"], None]) -> None:
+        """Applies one of our own writes to the cached snapshot of a board, so a batch of writes doesn't fetch
+        the whole board again after each of them. The snapshot keeps its dateLastActivity, so the next
+        board_version or publish still sees it's behind Trello and fetches the board once.
+
+        :param board_id: (str) The board we wrote to
+        :param change: (callable) Applies the write to the cached snapshot in place
+        """
+        snapshot = self._snapshots.get(board_id)
+        if snapshot:
+            change(snapshot)
+        if self.snapshot_store:
+            # The webhook for our change or the next publish stores it again
+            self.snapshot_store.discard(board_id)
+        for hook in self._invalidation_hooks:
+            hook(board_id)
+
+    @property
+    def _index(self) -> "BoardIndex":
+        with self._index_lock:
+            if self._board_index is None:
+                owner = "/organizations/{}".format(self._org_id(self.team_name)) if self.team_name else "/members/me"
+                self._board_index = BoardIndex(self.tc, owner)
+            return self._board_index
 
     @property
-    def boards(self) -> List[Board]:
-        """All the boards that can be accessed
+    def boards(self) -> List["BoardRef"]:
+        """All the open boards of the team
 
-        :return: (Board) list of Board
+        :return: (BoardRef) list of BoardRef
         """
-        return self.tc.list_boards()
+        self._index.refresh()
+        return self._index.boards
+
+    def has_board(self, board_name: str) -> bool:
+        try:
+            self._board(board_name)
+        except NoBoardError:
+            return False
+        return True
 
-    @lru_cache(maxsize=128)
     def _org_id(self, team_name: str) -> str:
         """Get the id of a Trello team
 
         :param team_name:
         :return:
         """
-        orgs = self.tc.list_organizations()
-        for org in orgs:
-            if org.name == team_name:
-                return org.id
-
-    @lru_cache(maxsize=128)
-    def _board(self, board_name):
-        logger.debug("Looking up board {}".format(board_name))
-        board = [b for b in self.boards if b.name == board_name]
-        try:
-            return board[0]
-        except IndexError as e:
-            raise NoBoardError from e
+        def lookup():
+            orgs = self.tc.list_organizations()
+            for org in orgs:
+                if org.name == team_name:
+                    return org.id
+
+        return self._lookups.get_or_set(("org", team_name), lookup)
+
+    def _board(self, board_name) -> "BoardRef":
+        board = self._index.lookup(name=board_name)
+        if not board:
+            raise NoBoardError
+        return board
 
-    @lru_cache(maxsize=128)
-    def _board_by_url(self, board_url):
-        board = [b for b in self.boards if b.url == board_url]
+    def _board_by_url(self, board_url) -> Optional["BoardRef"]:
+        return self._index.lookup(url=board_url)
+
+    def _snapshot(self, board_name: str) -> "BoardSnapshot":
+        board = self._board(board_name)
+        return self._snapshot_by_id(board.id)
+
+    def _snapshot_by_id(self, board_id: str) -> "BoardSnapshot":
+        return self._snapshots.get_or_set(board_id, lambda: self._stored_snapshot(board_id) or
+                                          BoardSnapshot.fetch(self.tc, board_id))
+
+    def _stored_snapshot(self, board_id: str) -> Optional["BoardSnapshot"]:
+        if not self.snapshot_store:
+            return
+        board = self.snapshot_store.get(board_id, max_age=self.store_max_age)
         if board:
-            return board[0]
+            return BoardSnapshot(board)
+
+    def _last_activity(self, board_id: str) -> str:
+        return self.tc.fetch_json("/boards/{}".format(board_id),
+                                  query_params={"fields": "dateLastActivity"})["dateLastActivity"]
+
+    def board_version(self, board_name: str) -> Tuple[str, str]:
+        """When a board last changed, according to Trello. A cheap way to tell whether what we cached is still good.
+        A cached snapshot older than that is dropped. Free when the board's stored snapshot is fresh.
 
-    @lru_cache(maxsize=128)
-    def _member(self, member_id: int, board_name: str) -> Optional[Card]:
-        member_id = str(member_id)
+        :param board_name: (str) The name of the board
+        :return: (tuple) The board's id and its dateLastActivity
+        """
+        board = self._board(board_name)
+        stored = self._stored_snapshot(board.id)
+        if stored:
+            self._snapshots.set(board.id, stored)
+            return board.id, stored.last_activity
+        last_activity = self._last_activity(board.id)
+        snapshot = self._snapshots.get(board.id)
+        if snapshot and snapshot.last_activity != last_activity:
+            self._snapshots.invalidate(board.id)
+        return board.id, last_activity
+
+    def publish(self, board_name: str) -> None:
+        """Stores the current snapshot of a board for other processes to read, e.g. after a sync.
+        The snapshot is only uploaded again when the board changed since it was last stored.
+
+        :param board_name: (str) The name of the board
+        """
+        if not self.snapshot_store:
+            return
+        board = self._board(board_name)
+        last_activity = self._last_activity(board.id)
+        stored = self.snapshot_store.get(board.id)
+        if stored and stored.get("dateLastActivity") == last_activity:
+            self.snapshot_store.touch(board.id)
+            return
+        snapshot = self._snapshots.get(board.id)
+        if not snapshot or snapshot.last_activity != last_activity:
+            snapshot = BoardSnapshot.fetch(self.tc, board.id)
+            self._snapshots.set(board.id, snapshot)
+        logger.debug("Publishing snapshot of {} at {}".format(board_name, snapshot.last_activity))
+        self.snapshot_store.put(board.id, snapshot.json)
+
+    def _member(self, member_id: int, board_name: str) -> Optional[dict]:
         try:
-            board = self._board(board_name)
+            snapshot = self._snapshot(board_name)
         except NoBoardError:
             return
+        return snapshot.member(member_id)
 
-        for l in board.list_lists(list_filter="open"):
-            for card in l.list_cards():
-                sleep(0.1)
-                if card.desc == member_id:
-                    return card
-
-    @lru_cache(maxsize=128)
     def _label(self, label_name, board_name):
-        board = self._board(board_name)
-        label = [l for l in board.get_labels() if l.name == label_name]
-        if label:
-            return label[0]
+        return self._snapshot(board_name).label(label_name)
 
     def participants(self, board_name):
-        board = self._board(board_name)
-        members = []
-        for l in board.list_lists(list_filter="open"):
-            for card in l.list_cards():
-                sleep(0.1)
-                try:
-                    members.append(int(card.desc))
-                except ValueError:
-                    pass
-        return members
+        return self._snapshot(board_name).participants
+
+    def canceled(self, board_name: str) -> List[int]:
+        """The member ids whose card on the board is already labelled Canceled"""
+        return self._snapshot(board_name).labelled("Canceled")
+
+    def _add_list(self, board_id, name, pos="bottom"):
+        return self.tc.fetch_json("/lists", http_method="POST",
+                                  post_args={"name": name, "idBoard": board_id, "pos": pos})
+
+    def _add_card(self, list_id, name, desc=None):
+        return self.tc.fetch_json("/cards", http_method="POST",
+                                  post_args={"name": name, "idList": list_id, "desc": desc})
 
     def create_board(self, board_name, team_name=None):
         logger.debug("Checking for board {} on {} team".format(board_name, team_name))
@@ -94,8 +287,18 @@ class TrelloBoard(object):
         try:
             self._board(board_name)
         except NoBoardError:
-            self.tc.add_board(board_name=board_name, source_board=template, organization_id=org_id,
-                              permission_level="public")
+            board = self.tc.add_board(board_name=board_name, source_board=template, organization_id=org_id,
+                                      permission_level="public")
+            self._index.add(BoardRef(id=board.id, name=board.name, url=board.url))
+            self.invalidate(board.id)
+
+    def _label_id(self, board_id: str, label_name: str) -> Optional[str]:
+        def lookup():
+            label = self._snapshot_by_id(board_id).label(label_name)
+            if label:
+                return label["id"]
+
+        return self._lookups.get_or_set(("label", board_id, label_name), lookup)
 
     def add_rsvp(self, name, member_id, board_name):
         logger.debug("Adding rsvp {} to {}".format(name, board_name))
@@ -104,50 +307,83 @@ class TrelloBoard(object):
         except NoBoardError:
             logger.debug("Board {} not found".format(board_name))
             return
-
-        if not self._member(member_id, board_name):
+        snapshot = self._snapshot_by_id(board.id)
+        card = None
+        if self.member_store:
+            self.member_store.save(Member(name=name, meetup_id=member_id))
+            # The card we remember may have been deleted or archived since, so it has to be on the board
+            card = snapshot.card(self.member_store.card_id(member_id, board.id))
+        card = card or snapshot.member(member_id)
+        if not card:
             logger.debug("Member {} does not exist in {}. Adding them.".format(member_id, board_name))
-            rsvp_list = board.list_lists(list_filter="open")[0]
-            logger.debug("RSVP list for {}: {}".format(board_name, rsvp_list))
-            rsvp_list.add_card(name=name, desc=str(member_id))
+            rsvp_list = snapshot.rsvp_list
+            logger.debug("RSVP list for {}: {}".format(board_name, rsvp_list["name"]))
+            card = self._add_card(rsvp_list["id"], name=name, desc=str(member_id))
+            self._wrote(snapshot.id, lambda s: s.add_card(card))
+        if self.member_store:
+            self.member_store.save_card(member_id, board.id, card["id"])
 
     def cancel_rsvp(self, member_id, board_name):
         logger.debug("Canceling RSVP for members id {} at {}".format(member_id, board_name))
-        member_card = self._member(member_id, board_name)
-        logger.debug("Card for member id {} is {}".format(member_id, member_card))
-        canceled = self._label("Canceled", board_name)
+        board = self._board(board_name)
+        snapshot = self._snapshot_by_id(board.id)
+        card = None
+        if self.member_store:
+            # The card we remember may have been deleted or archived since, so it has to be on the board
+            card = snapshot.card(self.member_store.card_id(member_id, board.id))
+        card = card or snapshot.member(member_id)
+        logger.debug("Card for member id {} is {}".format(member_id, card))
+        if not card:
+            return
+        card_id = card["id"]
+
+        canceled = self._label_id(board.id, "Canceled")
         logger.debug("Canceled tag is {}".format(canceled))
-        if member_card:
-            member_card.add_label(canceled)
+        if not canceled:
+            return
+        try:
+            self.tc.fetch_json("/cards/{}/idLabels".format(card_id), http_method="POST", post_args={"value": canceled})
+        except ResourceUnavailable as e:
+            if getattr(e, "_status", None) != 404:
+                raise
+            # Gone since our snapshot was taken. Find it on a fresh board next time
+            logger.warning("Card {} for member id {} is gone from {}, skipping".format(card_id, member_id,
+                                                                                        board_name))
+            if self.member_store:
+                self.member_store.forget_card(member_id, board.id)
+            self.invalidate(board.id)
+            return
+        if self.member_store:
+            self.member_store.save_card(member_id, board.id, card_id)
+        self._wrote(board.id, lambda s: s.add_label(card_id, canceled))
 
     def tables_for_event(self, event_name: str) -> Dict[int, GameTable]:
         tables = {}
         info_card = None
-        board = self._board(event_name)
+        snapshot = self._snapshot(event_name)
 
-        for board_list in board.list_lists(list_filter="open"):
-            if board_list.name.startswith("RSVP"):
+        for board_list in snapshot.lists:
+            if board_list["name"].startswith("RSVP"):
                 title = "Without a table :disappointed:"
                 table_number = 9999
             else:
-                table_number, title = board_list.name.split(". ", maxsplit=1)
+                table_number, title = board_list["name"].split(". ", maxsplit=1)
                 table_number = int(table_number)
 
             table = GameTable(number=table_number, title=title)
 
-            for card in board_list.list_cards():
-                sleep(0.1)
-                if card.name == "Info":
+            for card in snapshot.cards(board_list["id"]):
+                if card["name"] == "Info":
                     info_card = card
-                elif card.labels:
-                    for label in card.labels:
-                        if label.name == "GM":
-                            table.gm = card.name
+                elif card["labels"]:
+                    for label in card["labels"]:
+                        if label["name"] == "GM":
+                            table.gm = card["name"]
                 else:
-                    table.add_player(card.name)
+                    table.add_player(card["name"])
 
             if info_card:
-                full_info = info_card.desc.split("Players: ", 1)
+                full_info = info_card["desc"].split("Players: ", 1)
                 table.blurb = full_info[0]
                 if len(full_info) == 2:
                     try:
@@ -163,11 +399,249 @@ class TrelloBoard(object):
 
     def add_table(self, title, info, board_url):
         board = self._board_by_url(board_url)
-        table_numbers = [int(n.name.split(".", 1)[0]) for n in board.list_lists(list_filter="open") if
-                         n.name[0].isnumeric()]
+        snapshot = self._snapshot_by_id(board.id)
+        table_numbers = [int(n["name"].split(".", 1)[0]) for n in snapshot.lists if n["name"][0].isnumeric()]
         ordinal = max(table_numbers) + 1 if table_numbers else 1
         title = "{}. {}".format(ordinal, title)
-        table = board.add_list(name=title, pos="bottom")
+        table = self._add_list(snapshot.id, name=title, pos="bottom")
         info = "\n\nPlayers:".join(info.split("Players:"))
-        table.add_card("Info", desc=info)
-        return "Table *{}* added to *{}*".format(title, board.name)
+        card = self._add_card(table["id"], "Info", desc=info)
+
+        def change(cached):
+            cached.add_list(table)
+            cached.add_card(card)
+
+        self._wrote(snapshot.id, change)
+        return "Table *{}* added to *{}*".format(title, snapshot.name)
+
+
+BoardRef = namedtuple("BoardRef", ["id", "name", "url"])
+
+
+class BoardIndex(object):
+    fields = "name,url,closed,idOrganization"
+    board_actions = "createBoard,copyBoard,updateBoard,deleteBoard,addToOrganizationBoard,removeFromOrganizationBoard"
+
+    def __init__(self, client: TrelloClient, owner: str = "/members/me", min_refresh_interval: float = 10,
+                 full_reload_interval: float = 3600, clock: Callable[[], float] = monotonic):
+        """An in-memory index of the open boards of a Trello team or member, by name and by URL.
+        After the first load it's kept up to date from the owner's actions since the last refresh.
+
+        :param client: (TrelloClient) The client to use
+        :param owner: (str) "/organizations/<id>" for a team or "/members/me" for the token's member
+        :param min_refresh_interval: (float) Seconds between two checks for changes
+        :param full_reload_interval: (float) Seconds after which the index is rebuilt from scratch
+        :param clock: (callable) Returns the current time in seconds
+        """
+        self._client = client
+        self._owner = owner
+        self._org_id = owner.rsplit("/", 1)[-1] if owner.startswith("/organizations/") else None
+        self.min_refresh_interval = min_refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self._clock = clock
+        self._lock = RLock()
+        self._by_id = {}
+        self._by_name = {}
+        self._by_url = {}
+        self._since = None
+        self._loaded_at = None
+        self._refreshed_at = None
+
+    @property
+    def boards(self) -> List[BoardRef]:
+        return list(self._by_id.values())
+
+    def lookup(self, name: str = None, url: str = None) -> Optional[BoardRef]:
+        """Finds an open board by :name: or :url:, checking Trello for changes if it isn't known yet"""
+        def index():
+            # Reloading replaces the dicts, so they are looked up again after a refresh
+            return self._by_name if name is not None else self._by_url
+
+        key = name if name is not None else url
+        if key not in index():
+            self.refresh()
+        return index().get(key)
+
+    def refresh(self, force: bool = False) -> None:
+        with self._lock:
+            now = self._clock()
+            if not force and self._refreshed_at is not None and now - self._refreshed_at < self.min_refresh_interval:
+                return
+            if self._loaded_at is None or now - self._loaded_at >= self.full_reload_interval:
+                self._load()
+                self._loaded_at = now
+            else:
+                self._update()
+            self._refreshed_at = now
+
+    def add(self, board: BoardRef) -> None:
+        with self._lock:
+            self.remove(board.id)
+            self._by_id[board.id] = board
+            self._by_name.setdefault(board.name, board)
+            self._by_url[board.url] = board
+
+    def remove(self, board_id: str) -> None:
+        with self._lock:
+            board = self._by_id.pop(board_id, None)
+            if not board:
+                return
+            if self._by_name.get(board.name) == board:
+                del self._by_name[board.name]
+                same_name = [b for b in self._by_id.values() if b.name == board.name]
+                if same_name:
+                    self._by_name[board.name] = same_name[0]
+            self._by_url.pop(board.url, None)
+
+    def _apply(self, board_json: dict) -> None:
+        if board_json.get("closed") or (self._org_id and board_json.get("idOrganization") != self._org_id):
+            self.remove(board_json["id"])
+        else:
+            self.add(BoardRef(id=board_json["id"], name=board_json["name"], url=board_json["url"]))
+
+    def _latest_action_date(self) -> str:
+        actions = self._client.fetch_json(self._owner + "/actions", query_params={"limit": 1, "fields": "date"})
+        if actions:
+            return actions[0]["date"]
+        return datetime.now(timezone.utc).isoformat()
+
+    def _load(self) -> None:
+        logger.debug("Loading all open boards of {}".format(self._owner))
+        since = self._latest_action_date()
+        boards = self._client.fetch_json(self._owner + "/boards", query_params={"filter": "open",
+                                                                                "fields": self.fields})
+        self._by_id, self._by_name, self._by_url = {}, {}, {}
+        for board_json in boards:
+            self._apply(board_json)
+        self._since = since
+
+    def _update(self) -> None:
+        actions = self._client.fetch_json(self._owner + "/actions",
+                                          query_params={"filter": self.board_actions, "since": self._since,
+                                                        "fields": "date,data", "limit": 1000})
+        if not actions:
+            return
+        logger.debug("{} board changes in {} since {}".format(len(actions), self._owner, self._since))
+        changed = {a["data"]["board"]["id"] for a in actions if "board" in a.get("data", {})}
+        for board_id in changed:
+            try:
+                self._apply(self._client.fetch_json("/boards/{}".format(board_id),
+                                                    query_params={"fields": self.fields}))
+            except ResourceUnavailable:
+                self.remove(board_id)
+        # Actions come newest first
+        self._since = actions[0]["date"]
+
+
+class BoardSnapshot(object):
+    query_params = {
+        "fields": "name,url,dateLastActivity",
+        "lists": "open",
+        "list_fields": "name,pos,closed",
+        "cards": "open",
+        "card_fields": "name,desc,idList,labels,pos,closed",
+        "labels": "all",
+        "label_fields": "name,color",
+    }
+
+    def __init__(self, board_json: dict):
+        """The open lists, cards and labels of a board, as returned by a single GET /boards/{id}
+
+        :param board_json: (dict) The board, with its lists, cards and labels nested
+        """
+        self.json = board_json
+        self.id = board_json["id"]
+        self.name = board_json.get("name")
+        self.url = board_json.get("url")
+        self.last_activity = board_json.get("dateLastActivity")
+        self.lists = sorted([l for l in board_json.get("lists", []) if not l.get("closed")],
+                            key=lambda l: l.get("pos", 0))
+        self._labels = {l["name"]: l for l in board_json.get("labels", []) if l.get("name")}
+        self._cards = {l["id"]: [] for l in self.lists}
+        self._by_id = {}
+        self._members = {}
+
+        for card in sorted(board_json.get("cards", []), key=lambda c: c.get("pos", 0)):
+            if card.get("closed") or card["idList"] not in self._cards:
+                continue
+            self._cards[card["idList"]].append(card)
+            self._by_id[card["id"]] = card
+            self._members.setdefault(card.get("desc", ""), card)
+
+    @classmethod
+    def fetch(cls, client: TrelloClient, board_id: str) -> "BoardSnapshot":
+        """Loads a board with a single request
+
+        :param client: (TrelloClient) The client to use
+        :param board_id: (str) The id of the board
+        :return: (BoardSnapshot)
+        """
+        logger.debug("Fetching snapshot of board {}".format(board_id))
+        return cls(client.fetch_json("/boards/{}".format(board_id), query_params=cls.query_params))
+
+    @property
+    def rsvp_list(self) -> Optional[dict]:
+        """The list new RSVPs go to: the one named RSVP, or the first list if there's none"""
+        for board_list in self.lists:
+            if board_list["name"].startswith("RSVP"):
+                return board_list
+        return self.lists[0] if self.lists else None
+
+    def cards(self, list_id: str) -> List[dict]:
+        """The open cards of a list, in the order they appear on the board"""
+        return self._cards.get(list_id, [])
+
+    def card(self, card_id: str) -> Optional[dict]:
+        return self._by_id.get(card_id)
+
+    def add_card(self, card: dict) -> None:
+        """Adds a card we just created at the bottom of its list"""
+        if card.get("closed") or card["idList"] not in self._cards or card["id"] in self._by_id:
+            return
+        self.json.setdefault("cards", []).append(card)
+        self._cards[card["idList"]].append(card)
+        self._by_id[card["id"]] = card
+        self._members.setdefault(card.get("desc", ""), card)
+
+    def add_list(self, board_list: dict) -> None:
+        """Adds a list we just created at the bottom of the board"""
+        if board_list["id"] in self._cards:
+            return
+        self.json.setdefault("lists", []).append(board_list)
+        self.lists.append(board_list)
+        self._cards[board_list["id"]] = []
+
+    def add_label(self, card_id: str, label_id: str) -> None:
+        """Adds the label :label_id: to the card :card_id:"""
+        card = self.card(card_id)
+        label = [l for l in self.json.get("labels", []) if l["id"] == label_id]
+        if card and label and not any(l["id"] == label_id for l in card.get("labels", [])):
+            card.setdefault("labels", []).append(label[0])
+
+    def member(self, member_id: int) -> Optional[dict]:
+        """The card whose description is :member_id:"""
+        return self._members.get(str(member_id))
+
+    def label(self, label_name: str) -> Optional[dict]:
+        return self._labels.get(label_name)
+
+    @staticmethod
+    def _member_ids(cards: List[dict]) -> List[int]:
+        members = []
+        for card in cards:
+            try:
+                members.append(int(card.get("desc", "")))
+            except ValueError:
+                pass
+        return members
+
+    @property
+    def participants(self) -> List[int]:
+        """The member ids of all the cards on the board"""
+        # Our own writes may add members while we read
+        return self._member_ids(list(self._members.values()))
+
+    def labelled(self, label_name: str) -> List[int]:
+        """The member ids of the cards that carry the label :label_name:"""
+        return self._member_ids([c for c in list(self._members.values())
+                                 if any(l.get("name") == label_name for l in c.get("labels", []))])
@@ -0,0 +1,212 @@
+""" Receives Trello webhooks and keeps the stored board snapshots up to date with them
+https://developers.trello.com/page/webhooks
+"""
+import base64
+import hashlib
+import hmac
+import json
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Lock
+from typing import Iterable, Optional
+
+from trello import TrelloClient
+from trello.exceptions import ResourceUnavailable
+
+from dave.log import logger
+from dave.state import SnapshotStore
+from dave.trello_boards import BoardRef, BoardSnapshot
+
+CARD_FIELDS = ("name", "desc", "idList", "closed", "pos")
+LIST_FIELDS = ("name", "closed", "pos")
+
+
+def signature(body: bytes, callback_url: str, secret: str) -> str:
+    """The signature Trello sends in the X-Trello-Webhook header: base64(HMAC-SHA1(secret, body + callback URL))"""
+    digest = hmac.new(secret.encode(), body + callback_url.encode(), hashlib.sha1).digest()
+    return base64.b64encode(digest).decode()
+
+
+def verify_signature(body: bytes, callback_url: str, secret: str, received: Optional[str]) -> bool:
+    return bool(received) and hmac.compare_digest(signature(body, callback_url, secret), received)
+
+
+def _find(items: list, item_id: str) -> Optional[dict]:
+    for item in items:
+        if item["id"] == item_id:
+            return item
+
+
+def apply_action(board: dict, action: dict, client: TrelloClient) -> None:
+    """Applies a Trello action to a board snapshot in place. Cards and lists whose full state isn't in the action,
+    such as new ones, are fetched with one direct call.
+
+    :param board: (dict) The board, with its lists, cards and labels nested
+    :param action: (dict) The "action" of a webhook payload
+    :param client: (TrelloClient) Used to fetch what the action doesn't tell
+    """
+    action_type = action.get("type")
+    data = action.get("data", {})
+    cards, lists, labels = board.setdefault("cards", []), board.setdefault("lists", []), board.setdefault("labels", [])
+
+    if action_type in ("createCard", "copyCard", "moveCardToBoard", "convertToCardFromCheckItem"):
+        card_id = data["card"]["id"]
+        try:
+            card = client.fetch_json("/cards/{}".format(card_id),
+                                     query_params={"fields": BoardSnapshot.query_params["card_fields"]})
+        except ResourceUnavailable:
+            return
+        card["id"] = card_id
+        existing = _find(cards, card_id)
+        if existing:
+            existing.update(card)
+        else:
+            cards.append(card)
+    elif action_type == "updateCard":
+        card = _find(cards, data["card"]["id"])
+        if card:
+            card.update({f: data["card"][f] for f in CARD_FIELDS if f in data["card"]})
+    elif action_type in ("deleteCard", "moveCardFromBoard"):
+        board["cards"] = [c for c in cards if c["id"] != data["card"]["id"]]
+    elif action_type == "addLabelToCard":
+        card = _find(cards, data["card"]["id"])
+        if card and not _find(card.setdefault("labels", []), data["label"]["id"]):
+            card["labels"].append(data["label"])
+    elif action_type == "removeLabelFromCard":
+        card = _find(cards, data["card"]["id"])
+        if card:
+            card["labels"] = [l for l in card.get("labels", []) if l["id"] != data["label"]["id"]]
+    elif action_type in ("createList", "moveListToBoard"):
+        # These actions don't tell where the list is, which decides the order of the tables
+        list_id = data["list"]["id"]
+        try:
+            board_list = client.fetch_json("/lists/{}".format(list_id),
+                                           query_params={"fields": BoardSnapshot.query_params["list_fields"]})
+        except ResourceUnavailable:
+            return
+        board_list["id"] = list_id
+        existing = _find(lists, list_id)
+        if existing:
+            existing.update(board_list)
+        else:
+            lists.append(board_list)
+    elif action_type == "updateList":
+        existing = _find(lists, data["list"]["id"])
+        fields = {f: data["list"][f] for f in LIST_FIELDS if f in data["list"]}
+        if existing:
+            existing.update(fields)
+        else:
+            lists.append(dict(fields, id=data["list"]["id"]))
+    elif action_type == "moveListFromBoard":
+        board["lists"] = [l for l in lists if l["id"] != data["list"]["id"]]
+    elif action_type in ("createLabel", "updateLabel"):
+        existing = _find(labels, data["label"]["id"])
+        if existing:
+            existing.update(data["label"])
+        else:
+            labels.append(dict(data["label"]))
+    elif action_type == "deleteLabel":
+        board["labels"] = [l for l in labels if l["id"] != data["label"]["id"]]
+        for card in board["cards"]:
+            card["labels"] = [l for l in card.get("labels", []) if l["id"] != data["label"]["id"]]
+    elif action_type == "updateBoard":
+        board.update({f: data["board"][f] for f in ("name", "closed") if f in data.get("board", {})})
+    else:
+        logger.debug("Ignoring {} action".format(action_type))
+
+    if action.get("date"):
+        board["dateLastActivity"] = action["date"]
+
+
+class WebhookReceiver(object):
+    def __init__(self, client: TrelloClient, store: SnapshotStore, secret: str, callback_url: str) -> None:
+        """Applies the actions Trello posts for our boards to the snapshots in :store:
+
+        :param client: (TrelloClient) Used to register webhooks and to fetch what actions don't tell
+        :param store: (SnapshotStore) Where the board snapshots live
+        :param secret: (str) The Trello API secret webhooks are signed with
+        :param callback_url: (str) The public URL Trello posts to
+        """
+        self.client = client
+        self.store = store
+        self.secret = secret
+        self.callback_url = callback_url
+        self._lock = Lock()
+
+    def _load(self, board_id: str) -> dict:
+        board = self.client.fetch_json("/boards/{}".format(board_id), query_params=BoardSnapshot.query_params)
+        self.store.put(board_id, board)
+        return board
+
+    def handle(self, body: bytes, received_signature: Optional[str]) -> int:
+        """Handles one webhook call
+
+        :return: (int) The HTTP status to answer with
+        """
+        if not verify_signature(body, self.callback_url, self.secret, received_signature):
+            logger.warning("Rejected a webhook call with a bad signature")
+            return 401
+        try:
+            payload = json.loads(body.decode())
+            board_id = payload["model"]["id"]
+            action = payload["action"]
+        except (ValueError, KeyError, TypeError):
+            return 400
+
+        logger.debug("{} on board {}".format(action.get("type"), board_id))
+        with self._lock:
+            board = self.store.get(board_id)
+            if board is None:
+                self._load(board_id)
+            else:
+                apply_action(board, action, self.client)
+                self.store.put(board_id, board)
+        return 200
+
+    def register(self, boards: Iterable[BoardRef]) -> None:
+        """Makes sure every board in :boards: has a webhook pointing at us and a stored snapshot.
+        Boards whose webhook is active are confirmed current in the store.
+        """
+        hooks = {h.id_model: h for h in self.client.list_hooks() if h.callback_url == self.callback_url}
+        for board in boards:
+            hook = hooks.get(board.id)
+            if not hook:
+                hook = self.client.create_hook(self.callback_url, board.id, desc="Bot Dave: {}".format(board.name))
+                if not hook:
+                    logger.warning("Couldn't register a webhook for {}".format(board.name))
+                    continue
+                logger.info("Registered a webhook for {}".format(board.name))
+                self._load(board.id)
+            elif self.store.get(board.id) is None:
+                self._load(board.id)
+            if hook.active:
+                self.store.touch(board.id)
+
+    def serve(self, host: str = "0.0.0.0", port: int = 8000) -> HTTPServer:
+        server = _Server((host, port), _Handler)
+        server.receiver = self
+        return server
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_HEAD(self):
+        # Trello checks the callback URL answers before creating a webhook
+        self.send_response(200)
+        self.end_headers()
+
+    def do_GET(self):
+        self.do_HEAD()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        status = self.server.receiver.handle(body, self.headers.get("X-Trello-Webhook"))
+        self.send_response(status)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logger.debug("Webhook receiver: " + format % args)
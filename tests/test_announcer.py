@@ -0,0 +1,41 @@
+import unittest
+from time import sleep
+
+from dave.slack import Announcer
+
+
+class FakeSlack(object):
+    def __init__(self):
+        self.sent = []
+
+    def send_attachment(self, message, channel, title=None, colour="#808080", extra_options=None):
+        self.sent.append((channel, message, colour))
+
+
+class TestAnnouncer(unittest.TestCase):
+
+    def setUp(self):
+        self.slack = FakeSlack()
+        self.announcer = Announcer(self.slack, flush_after=0.05, channel_interval=0.05)
+
+    def test_coalesces_changes_per_event(self):
+        self.announcer.rsvps("#storg-south", "January Event", joined=["Dave"], spots=3)
+        self.announcer.rsvps("#storg-south", "January Event", canceled=["John"], spots=4, waitlist=2)
+        sleep(0.3)
+        self.assertEqual(len(self.slack.sent), 1)
+        channel, text, _ = self.slack.sent[0]
+        self.assertEqual(channel, "#storg-south")
+        self.assertEqual(text, "Dave replied yes for the January Event\nJohn replied no for the January Event\n"
+                               "4 spots left\n2 in the waiting list")
+
+    def test_flush(self):
+        announcer = Announcer(self.slack, flush_after=60)
+        announcer.rsvps("#storg-north", "Northern Event", canceled=["Jane"], spots=1)
+        announcer.rsvps(None, "Nowhere Event", joined=["Dave"], spots=1)
+        announcer.flush()
+        self.assertEqual(self.slack.sent, [("#storg-north", "Jane replied no for the Northern Event\n1 spots left",
+                                            "b20000")])
+
+
+if __name__ == '__main__':
+    unittest.main()
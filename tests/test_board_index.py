@@ -0,0 +1,25 @@
+import unittest
+
+from dave.trello_boards import BoardIndex
+
+
+class FakeTrello(object):
+    def __init__(self):
+        self.boards = [{"id": "b1", "name": "January Event", "url": "https://trello.com/b/b1", "closed": False,
+                        "idOrganization": "org"}]
+
+    def fetch_json(self, uri_path, query_params=None, **kwargs):
+        if uri_path.endswith("/actions"):
+            return [{"date": "2018-05-22T10:00:00.000Z"}] if "since" not in query_params else []
+        if uri_path.endswith("/boards"):
+            return self.boards
+        raise AssertionError(uri_path)
+
+
+class TestBoardIndex(unittest.TestCase):
+
+    def test_first_lookup_loads_the_index(self):
+        index = BoardIndex(FakeTrello(), owner="/organizations/org")
+        self.assertEqual(index.lookup(name="January Event").id, "b1")
+        self.assertEqual(index.lookup(url="https://trello.com/b/b1").id, "b1")
+        self.assertIsNone(index.lookup(name="February Event"))
@@ -0,0 +1,91 @@
+import copy
+import json
+import os
+import unittest
+from time import monotonic
+from unittest.mock import patch
+
+from dave.bot import Bot
+from dave.data_types import Event
+from tests.test_trello_boards import BOARD, RSVP_LIST, FakeTrello, trello_board
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENVIRON = {"SLACK_API_TOKEN": "xoxb-token", "BOT_ID": "UBOT", "TRELLO_API_KEY": "key", "TRELLO_TOKEN": "token",
+           "TRELLO_TEAM": "org", "MEETUP_API_KEY": "key", "MEETUP_GROUP_ID": "1",
+           "DATABASE_URL": "sqlite:///:memory:"}
+
+
+EVENT = Event(id=1, name="January Event", time=1527344911000, status="upcoming", rsvp_limit=40, waitlist_count=0,
+              yes_rsvp_count=4, announced=True, event_url="https://www.example.com/", venue={"name": "STORG Clubhouse"})
+
+
+def make_bot(test):
+    """A Bot talking to a fake Trello, with EVENT as the only upcoming event"""
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    test.addCleanup(os.chdir, cwd)
+    with patch.dict(os.environ, ENVIRON):
+        bot = Bot()
+    client = FakeTrello(copy.deepcopy(BOARD))
+    bot.trello.tc = client
+    bot.trello._board_index = trello_board(client)._board_index
+    bot.published_events.put("1", [EVENT])
+    return bot, client
+
+
+class TestRenderedTables(unittest.TestCase):
+
+    def setUp(self):
+        self.bot, self.client = make_bot(self)
+
+    def status(self):
+        return json.loads(self.bot._tables_info("storg-south"))
+
+    def test_same_version_is_a_hit(self):
+        first = self.status()
+        self.bot.trello._snapshots.clear()
+        self.assertEqual(self.status(), first)
+        self.assertEqual(self.client.board_fetches(), 1)
+
+    def test_new_version_is_a_miss(self):
+        self.status()
+        self.client.board["cards"].append({"id": "5b0d4d5c2b8d31f1e7a39a86", "name": "John", "desc": "100004",
+                                           "idList": RSVP_LIST, "closed": False, "pos": 65536, "labels": []})
+        self.client.board["dateLastActivity"] = "2018-05-22T11:00:00.000Z"
+        self.assertEqual(self.status()[-1]["fields"][0]["value"], "*2 left:* Dave and John")
+
+    def test_our_writes_drop_the_renders(self):
+        self.status()
+        self.assertEqual(len(self.bot._rendered_tables), 1)
+        self.bot.trello.add_rsvp("John", 100004, "January Event")
+        self.assertEqual(len(self.bot._rendered_tables), 0)
+        self.status()
+        self.bot.trello.invalidate(None)
+        self.assertEqual(len(self.bot._rendered_tables), 0)
+
+
+class TestSync(unittest.TestCase):
+
+    def setUp(self):
+        self.bot, self.client = make_bot(self)
+
+    def test_skips_an_event_already_being_synced(self):
+        lock = self.bot._event_locks[EVENT.event_id]
+        lock.acquire()
+        self.addCleanup(lock.release)
+        self.assertEqual(self.bot._sync_event(EVENT), 0.0)
+        self.assertEqual(self.client.calls, [])
+        self.assertEqual(self.bot.storg.client.calls, 0)
+        self.assertEqual(self.bot.scheduler.due([EVENT]), [EVENT])
+
+    def test_logs_how_long_each_event_took(self):
+        self.bot.storg._events, self.bot.storg._events_checked_at = [EVENT], monotonic()
+        self.bot._sync_event = lambda event: 1.5
+        self.bot._api_calls = lambda: 0
+        with self.assertLogs("dave", "INFO") as logs:
+            self.bot.check_events()
+        self.assertIn("January Event: 1.5s", logs.output[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+from dave.cache import TTLCache
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TTLCache(ttl=10, maxsize=2, clock=self.clock)
+
+    def test_expires(self):
+        self.cache.set("board", 1)
+        self.clock.now = 9
+        self.assertEqual(self.cache.get("board"), 1)
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get("board"))
+
+    def test_get_or_set_counts_hits_and_misses(self):
+        loads = []
+        for _ in range(3):
+            self.cache.get_or_set("board", lambda: loads.append(1) or "value")
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(self.cache.stats, {"hits": 2, "misses": 1, "size": 1})
+
+    def test_exceptions_are_not_cached(self):
+        def missing():
+            raise KeyError
+
+        with self.assertRaises(KeyError):
+            self.cache.get_or_set("board", missing)
+        self.assertEqual(self.cache.get_or_set("board", lambda: "created"), "created")
+
+    def test_invalidate(self):
+        self.cache.set(("name", "January Event"), 1)
+        self.cache.set(("url", "https://trello.com/b/1"), 1)
+        self.cache.invalidate_where(lambda key: key[0] == "name")
+        self.assertIsNone(self.cache.get(("name", "January Event")))
+        self.assertEqual(self.cache.get(("url", "https://trello.com/b/1")), 1)
+
+    def test_maxsize(self):
+        self.cache.set("a", 1)
+        self.clock.now = 1
+        self.cache.set("b", 2)
+        self.cache.set("c", 3)
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get("a"))
+
+
+if __name__ == '__main__':
+    unittest.main()
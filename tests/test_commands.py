@@ -0,0 +1,33 @@
+import unittest
+
+from dave.commands import CommandRouter
+
+
+class TestCommandRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.router = CommandRouter(fallback=lambda command, match: "fallback")
+        self.router.add("table_status", r"table status", lambda command, match: command[match.end():].strip())
+        self.router.add("table", r"table\s*(?P<number>\d+)", lambda command, match: int(match.group("number")))
+        self.router.add("next_event", r"(?!.*events).*next event", lambda command, match: "next")
+        self.router.add("events", r".*events", lambda command, match: "all")
+
+    def test_patterns_are_tried_in_order(self):
+        self.assertEqual(self.router.dispatch("What's the next event?"), ("next_event", "next"))
+        self.assertEqual(self.router.dispatch("next events please"), ("events", "all"))
+
+    def test_named_groups_and_case(self):
+        self.assertEqual(self.router.dispatch("Table 4"), ("table", 4))
+        self.assertEqual(self.router.dispatch("TABLE STATUS January Event"), ("table_status", "January Event"))
+
+    def test_fallback(self):
+        self.assertEqual(self.router.dispatch("hello"), (None, "fallback"))
+
+    def test_stats(self):
+        self.router.dispatch("table 1")
+        self.router.dispatch("table 2")
+        self.assertEqual(self.router.stats["table"]["count"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
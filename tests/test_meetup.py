@@ -0,0 +1,187 @@
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from dave.exceptions import MeetupError
+from dave.meetup import MeetupClient, MeetupGroup
+
+RSVPS_URL = "https://api.meetup.com/2/rsvps"
+
+
+class FakeResponse(object):
+    def __init__(self, url, status_code=200, body=None, headers=None):
+        self.url = url
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+        self.text = str(body)
+
+    def json(self):
+        if self.body is None:
+            raise ValueError("No JSON object could be decoded")
+        return self.body
+
+
+class FakeSession(object):
+    def __init__(self, responses):
+        """Answers each GET with the next of :responses:: (status, body, headers) or an exception to raise"""
+        self.responses = list(responses)
+        self.requests = []
+        self.headers = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.requests.append((url, params))
+        self.headers.append(headers or {})
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        status, body, headers = response
+        return FakeResponse(url, status, body, headers)
+
+
+def rate_limit(remaining, reset):
+    return {"X-RateLimit-Remaining": str(remaining), "X-RateLimit-Reset": str(reset)}
+
+
+def event(event_id, name, time):
+    return {"id": str(event_id), "name": name, "time": time, "status": "upcoming", "rsvp_limit": 40,
+            "waitlist_count": 0, "yes_rsvp_count": 10, "announced": True, "updated": 1527000000000,
+            "event_url": "https://www.meetup.com/Stockholm-Roleplaying-Guild/events/{}/".format(event_id),
+            "venue": {"name": "STORG Clubhouse"}}
+
+
+def page(names, next_url=""):
+    return {"results": [{"member": {"member_id": i, "name": n}, "response": "yes"} for i, n in enumerate(names)],
+            "meta": {"next": next_url}}
+
+
+@patch("dave.meetup.sleep")
+class TestMeetupClient(unittest.TestCase):
+
+    def client(self, *responses, **kwargs):
+        client = MeetupClient(**kwargs)
+        client.session = FakeSession(responses)
+        return client
+
+    def test_retries_server_errors(self, sleep):
+        client = self.client((502, None, {}), (200, {"results": []}, {}))
+        self.assertEqual(client.get("/2/events", {}), {"results": []})
+        self.assertEqual(client.calls, 2)
+        self.assertEqual(sleep.call_count, 1)
+
+    def test_gives_up_after_the_retries(self, sleep):
+        client = self.client(*[(503, None, {})] * 3, retries=2)
+        with self.assertRaises(MeetupError):
+            client.get("/2/events", {})
+        self.assertEqual(client.calls, 3)
+
+    def test_does_not_retry_client_errors(self, sleep):
+        client = self.client((401, {"errors": [{"code": "auth_fail"}]}, {}))
+        with self.assertRaisesRegex(MeetupError, "401"):
+            client.get("/2/events", {})
+        self.assertEqual(client.calls, 1)
+        sleep.assert_not_called()
+
+    def test_connection_errors_and_invalid_json(self, sleep):
+        client = self.client(requests.ConnectionError("refused"), (200, None, {}))
+        with self.assertRaisesRegex(MeetupError, "invalid JSON"):
+            client.get("/2/events", {})
+        self.assertEqual(client.calls, 2)
+
+    def test_waits_for_the_reset_after_429(self, sleep):
+        client = self.client((429, None, rate_limit(0, 7)), (200, {}, {}), backoff=0.1)
+        client.get("/2/events", {})
+        self.assertGreater(sleep.call_args[0][0], 6.5)
+
+    def test_spreads_calls_when_running_low(self, sleep):
+        client = self.client((200, {}, rate_limit(10, 10)), (200, {}, rate_limit(2, 10)), (200, {}, {}))
+        client.get("/2/events", {})
+        client.get("/2/events", {})
+        sleep.assert_not_called()
+        client.get("/2/events", {})
+        self.assertAlmostEqual(sleep.call_args[0][0], 5, delta=0.5)
+
+
+@patch("dave.meetup.sleep")
+class TestMeetupGroupRsvps(unittest.TestCase):
+
+    def group(self, *responses):
+        client = MeetupClient()
+        client.session = FakeSession(responses)
+        return MeetupGroup("key", "1", client=client)
+
+    def test_follows_next_links_lazily(self, sleep):
+        next_url = RSVPS_URL + "?event_id=1&key=key&page=2&offset=1"
+        group = self.group((200, page(["Dave", "Jane"], next_url), {}), (200, page(["John"]), {}))
+        rsvps = group.rsvps("1", page_size=2)
+        self.assertEqual(next(rsvps).member["name"], "Dave")
+        self.assertEqual(len(group.client.session.requests), 1)
+        self.assertEqual([r.member["name"] for r in rsvps], ["Jane", "John"])
+        self.assertEqual(group.client.session.requests[1], (next_url, None))
+        self.assertEqual(group.client.session.requests[0][1]["page"], 2)
+
+    def test_failed_page_raises(self, sleep):
+        group = self.group((200, page(["Dave"], RSVPS_URL + "?offset=1"), {}), (400, None, {}))
+        with self.assertRaises(MeetupError):
+            list(group.rsvps("1"))
+
+    def test_page_without_results_raises(self, sleep):
+        group = self.group((200, {"problem": "Invalid event"}, {}))
+        with self.assertRaisesRegex(MeetupError, "no results"):
+            list(group.rsvps("1"))
+
+
+@patch("dave.meetup.monotonic")
+@patch("dave.meetup.sleep")
+class TestMeetupGroupEvents(unittest.TestCase):
+
+    def setUp(self):
+        self.events = {"results": [event(2, "February Event", 1530000000000), event(1, "January Event", 1527000000000)],
+                       "meta": {"next": ""}}
+        self.validators = {"ETag": '"v1"', "Last-Modified": "Tue, 22 May 2018 10:00:00 GMT"}
+
+    def group(self, *responses):
+        client = MeetupClient()
+        client.session = FakeSession(responses)
+        return MeetupGroup("key", "1", client=client, events_ttl=60)
+
+    def test_reused_within_the_ttl(self, sleep, monotonic):
+        monotonic.return_value = 1000
+        group = self.group((200, self.events, self.validators))
+        self.assertEqual(group.event_names, ["January Event", "February Event"])
+        monotonic.return_value = 1059
+        self.assertEqual(group.next_event.name, "January Event")
+        self.assertEqual(len(group.client.session.requests), 1)
+        self.assertEqual(group.client.session.headers[0], {})
+
+    def test_kept_when_not_modified(self, sleep, monotonic):
+        monotonic.return_value = 1000
+        group = self.group((200, self.events, self.validators), (304, None, {}))
+        first = group.upcoming_events
+        monotonic.return_value = 1061
+        self.assertEqual([e.event_id for e in group.upcoming_events], [e.event_id for e in first])
+        self.assertEqual(group.client.session.headers[1],
+                         {"If-None-Match": '"v1"', "If-Modified-Since": "Tue, 22 May 2018 10:00:00 GMT"})
+
+    def test_downloaded_again_when_modified(self, sleep, monotonic):
+        monotonic.return_value = 1000
+        changed = {"results": [event(3, "March Event", 1533000000000)], "meta": {"next": ""}}
+        group = self.group((200, self.events, self.validators), (200, changed, {"ETag": '"v2"'}))
+        group.upcoming_events
+        monotonic.return_value = 1061
+        self.assertEqual(group.event_names, ["March Event"])
+
+    def test_invalidate(self, sleep, monotonic):
+        monotonic.return_value = 1000
+        group = self.group((200, self.events, self.validators), (200, self.events, self.validators))
+        group.upcoming_events
+        group.invalidate_events()
+        group.upcoming_events
+        self.assertEqual(len(group.client.session.requests), 2)
+        # Nothing is cached any more, so there's nothing to validate either
+        self.assertEqual(group.client.session.headers[1], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from urllib.request import urlopen
+
+from dave.metrics import Registry, endpoint
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_endpoint(self):
+        self.assertEqual(endpoint("/1/boards/5b0d4d5c2b8d31f1e7a39a52/lists"), "/1/boards/{id}/lists")
+        self.assertEqual(endpoint("/2/rsvps?event_id=249792023"), "/2/rsvps")
+        self.assertEqual(endpoint("chat.postMessage"), "chat.postMessage")
+
+    def test_counter(self):
+        calls = self.registry.counter("dave_calls_total", "Calls")
+        calls.inc(api="meetup")
+        calls.inc(2, api="meetup")
+        self.assertIs(self.registry.counter("dave_calls_total", "Calls"), calls)
+        text = self.registry.render()
+        self.assertIn("# TYPE dave_calls_total counter\n", text)
+        self.assertIn('dave_calls_total{api="meetup"} 3.0\n', text)
+
+    def test_histogram(self):
+        seconds = self.registry.histogram("dave_seconds", "Seconds", buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 2):
+            seconds.observe(value, stage="sync")
+        self.assertEqual(seconds.value(stage="sync"), (4, 2.65))
+        text = self.registry.render()
+        self.assertIn('dave_seconds_bucket{stage="sync",le="0.1"} 2.0\n', text)
+        self.assertIn('dave_seconds_bucket{stage="sync",le="1.0"} 3.0\n', text)
+        self.assertIn('dave_seconds_bucket{stage="sync",le="+Inf"} 4.0\n', text)
+        self.assertIn('dave_seconds_count{stage="sync"} 4.0\n', text)
+
+    def test_collectors_run_before_every_read(self):
+        size = self.registry.gauge("dave_cache_entries", "Entries")
+        self.registry.add_collector(lambda: size.set(42, cache="snapshots"))
+        self.assertIn('dave_cache_entries{cache="snapshots"} 42.0\n', self.registry.render())
+
+    def test_serve(self):
+        self.registry.counter("dave_calls_total", "Calls").inc()
+        server = self.registry.serve(host="127.0.0.1", port=0)
+        try:
+            with urlopen("http://127.0.0.1:{}/metrics".format(server.server_address[1]), timeout=5) as response:
+                self.assertIn("dave_calls_total 1.0", response.read().decode())
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,81 @@
+import unittest
+
+from dave.data_types import Rsvp
+from dave.reconcile import reconcile, Watermark
+
+
+def rsvp(member_id, name, response, mtime=None):
+    return Rsvp(venue="STORG Clubhouse", response=response, answers=[],
+                member={"member_id": member_id, "name": name}, mtime=mtime)
+
+
+class TestReconcile(unittest.TestCase):
+
+    def setUp(self):
+        self.rsvps = [rsvp(1, "Dave", "yes"), rsvp(2, "Jane", "yes"), rsvp(3, "John", "no"),
+                      rsvp(4, "Doe", "no"), rsvp(5, "Alice", "waitlist")]
+
+    def test_newcomers_are_yes_rsvps_not_on_board(self):
+        diff = reconcile(self.rsvps, [2, 3])
+        self.assertEqual(diff.newcomer_names, ["Dave"])
+
+    def test_cancels_are_no_rsvps_on_board(self):
+        diff = reconcile(self.rsvps, [2, 3])
+        self.assertEqual(diff.cancel_names, ["John"])
+
+    def test_waitlist(self):
+        diff = reconcile(self.rsvps, [])
+        self.assertEqual(diff.waitlist_names, ["Alice"])
+
+    def test_no_changes(self):
+        diff = reconcile(self.rsvps, [1, 2])
+        self.assertFalse(diff)
+
+    def test_already_canceled_cards(self):
+        diff = reconcile(self.rsvps, [2, 3, 4], canceled=[3])
+        self.assertEqual(diff.cancel_names, ["Doe"])
+
+
+class TestWatermark(unittest.TestCase):
+
+    def setUp(self):
+        self.rsvps = [rsvp(1, "Dave", "yes", mtime=100), rsvp(2, "Jane", "no", mtime=300),
+                      rsvp(3, "John", "yes", mtime=200)]
+
+    def test_first_sync_lets_everything_through(self):
+        watermark = Watermark()
+        self.assertEqual(len(list(watermark.filter(self.rsvps))), 3)
+        self.assertEqual(watermark.latest, 300)
+
+    def test_only_modified_rsvps(self):
+        watermark = Watermark(since=200)
+        names = [r.member["name"] for r in watermark.filter(self.rsvps)]
+        self.assertEqual(names, ["Jane"])
+        self.assertEqual(watermark.latest, 300)
+        self.assertEqual(watermark.seen, {2})
+
+    def test_unseen_rsvps_on_the_watermark(self):
+        rsvps = self.rsvps + [rsvp(4, "Doe", "yes", mtime=200)]
+        names = [r.member["name"] for r in Watermark(since=200, seen={3}).filter(rsvps)]
+        self.assertEqual(names, ["Jane", "Doe"])
+
+    def test_consecutive_syncs(self):
+        board, canceled, announced = {1}, set(), []
+
+        def sync(rsvps, watermark):
+            diff = reconcile(watermark.filter(rsvps), board, canceled)
+            board.update(r.member["member_id"] for r in diff.newcomers)
+            canceled.update(r.member["member_id"] for r in diff.cancels)
+            announced.append((diff.newcomer_names, diff.cancel_names, diff.waitlist_names))
+            return Watermark(since=watermark.latest, seen=watermark.seen)
+
+        rsvps = [rsvp(1, "Dave", "no", mtime=150), rsvp(2, "Alice", "waitlist", mtime=150)]
+        watermark = sync(rsvps, Watermark(since=100, seen=set()))
+        rsvps.append(rsvp(3, "Jane", "yes", mtime=200))
+        watermark = sync(rsvps, watermark)
+        sync(rsvps, watermark)
+        self.assertEqual(announced, [([], ["Dave"], ["Alice"]), (["Jane"], [], []), ([], [], [])])
+
+
+if __name__ == '__main__':
+    unittest.main()
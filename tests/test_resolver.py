@@ -0,0 +1,39 @@
+import unittest
+
+from dave.data_types import Event
+from dave.resolver import EventResolver
+
+
+def event(event_id, name, venue):
+    return Event(id=event_id, name=name, time=1527344911000 + event_id, status="upcoming", rsvp_limit=40,
+                 waitlist_count=0, yes_rsvp_count=10, announced=True, event_url="https://www.example.com/",
+                 venue={"name": venue})
+
+
+class TestEventResolver(unittest.TestCase):
+
+    def setUp(self):
+        self.resolver = EventResolver(aliases={"north": "STORG Northern Clubhouse"})
+        self.resolver.update([event(1, "January Event", "STORG Clubhouse"),
+                              event(2, "Northern January Event", "STORG Northern Clubhouse"),
+                              event(3, "February Event", "STORG Clubhouse")])
+
+    def test_exact(self):
+        self.assertEqual(self.resolver.resolve("february event"), "February Event")
+
+    def test_alias(self):
+        self.assertEqual(self.resolver.resolve("North"), "Northern January Event")
+
+    def test_channel_venue(self):
+        self.assertEqual(self.resolver.resolve("", channel="storg-north"), "Northern January Event")
+
+    def test_fuzzy(self):
+        self.assertEqual(self.resolver.resolve("febuary"), "February Event")
+
+    def test_no_events(self):
+        self.resolver.update([])
+        self.assertIsNone(self.resolver.resolve("january"))
+
+
+if __name__ == '__main__':
+    unittest.main()
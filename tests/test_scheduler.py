@@ -0,0 +1,70 @@
+import unittest
+
+from dave.data_types import Event
+from dave.scheduler import SyncScheduler
+
+DAY = 24 * 3600
+
+
+def event(event_id, starts_in):
+    return Event(id=event_id, name="Event {}".format(event_id), time=(1000000 + starts_in) * 1000, status="upcoming",
+                 rsvp_limit=40, waitlist_count=0, yes_rsvp_count=10, announced=True, event_url="", venue={})
+
+
+class TestSyncScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000000
+        self.scheduler = SyncScheduler(min_interval=60, max_interval=4 * 3600, budget=10, jitter=0.2,
+                                       clock=lambda: self.now, rand=lambda: 0.5)
+
+    def test_closer_events_are_polled_more_often(self):
+        tomorrow = self.scheduler.interval(event(1, DAY))
+        next_month = self.scheduler.interval(event(2, 30 * DAY))
+        self.assertEqual(tomorrow, 120)
+        self.assertEqual(next_month, 3600)
+        self.assertEqual(self.scheduler.interval(event(3, 3600)), 60)
+        self.assertEqual(self.scheduler.interval(event(4, 365 * DAY)), 4 * 3600)
+
+    def test_churn_shortens_the_interval(self):
+        soon = event(1, 7 * DAY)
+        quiet = self.scheduler.synced(soon, changes=0)
+        busy = self.scheduler.synced(soon, changes=3)
+        self.assertLess(busy, quiet)
+
+    def test_new_events_are_due_until_synced(self):
+        tomorrow, far = event(1, DAY), event(2, 60 * DAY)
+        self.assertEqual(len(self.scheduler.due([tomorrow, far])), 2)
+        self.scheduler.synced(tomorrow)
+        self.scheduler.synced(far)
+        self.assertEqual(self.scheduler.due([tomorrow, far]), [])
+        self.assertEqual(self.scheduler.sleep_time(longest=600), 120)
+
+        self.now += 120
+        self.assertEqual(self.scheduler.due([tomorrow, far]), [tomorrow])
+
+    def test_jitter(self):
+        self.scheduler._rand = lambda: 0.0
+        self.assertAlmostEqual(self.scheduler.synced(event(1, DAY)), 120 * 0.8)
+        self.scheduler._rand = lambda: 0.999999
+        self.assertAlmostEqual(self.scheduler.synced(event(1, DAY)), 120 * 1.2, places=3)
+
+    def test_budget(self):
+        events = [event(i, DAY) for i in range(10)]
+        self.scheduler.spent(calls=50, syncs=5)
+        self.assertEqual(self.scheduler.cost_per_sync, 5.5)
+        self.assertEqual(len(self.scheduler.due(events)), 1)
+        self.scheduler.budget = 0
+        self.assertEqual(len(self.scheduler.due(events)), 1)
+
+    def test_overdue_events_wait_the_shortest_interval(self):
+        events = [event(i, DAY) for i in range(3)]
+        # The budget only covered the first, or the cycle failed before syncing any
+        self.scheduler.synced(self.scheduler.due(events)[0])
+        self.assertEqual(self.scheduler.sleep_time(longest=600), 60)
+        self.assertEqual(self.scheduler.sleep_time(longest=30), 30)
+
+    def test_forgets_past_events(self):
+        self.scheduler.synced(event(1, DAY))
+        self.scheduler.due([])
+        self.assertEqual(self.scheduler.sleep_time(longest=600), 600)
@@ -0,0 +1,124 @@
+import socket
+import unittest
+from queue import Queue
+
+from dave.slack import Slack
+
+CHANNEL = {"id": "C0SOUTH", "name": "storg-south", "topic": {"value": "<https://trello.com/b/b1>"}}
+
+
+class FakeSlackClient(object):
+    def __init__(self):
+        self.channels = {CHANNEL["id"]: dict(CHANNEL)}
+        self.calls = []
+
+    def api_call(self, method, **kwargs):
+        self.calls.append(method)
+        if method == "im.list":
+            return {"ok": True, "ims": [{"id": "W0DM"}]}
+        if method == "channels.info":
+            channel = self.channels.get(kwargs["channel"])
+            return {"ok": True, "channel": dict(channel)} if channel else {"ok": False, "error": "channel_not_found"}
+        return {"ok": True}
+
+
+class FakeServer(object):
+    def __init__(self, sock):
+        self.websocket = self
+        self.sock = sock
+        self.pings = 0
+
+    def ping(self):
+        self.pings += 1
+
+
+class FakeRtmClient(object):
+    def __init__(self, frames):
+        """Receives a burst of :frames: in a single TLS record: the socket is readable once,
+        then every frame has to be read from the SSL buffer, one per rtm_read
+        """
+        self._ours, self._theirs = socket.socketpair()
+        self._ours.setblocking(False)
+        self._theirs.send(b"record")
+        self.server = FakeServer(self._ours)
+        self.frames = list(frames)
+
+    def rtm_read(self):
+        try:
+            self._ours.recv(1024)
+        except BlockingIOError:
+            pass
+        return [self.frames.pop(0)] if self.frames else []
+
+    def close(self):
+        self._ours.close()
+        self._theirs.close()
+
+
+class TestChannels(unittest.TestCase):
+
+    def setUp(self):
+        self.slack = Slack("xoxb-token", "UBOT")
+        self.slack.sc = FakeSlackClient()
+
+    def test_names_are_cached(self):
+        self.assertEqual(self.slack.channel_name("C0SOUTH"), "storg-south")
+        self.assertEqual(self.slack.channel_name("C0SOUTH"), "storg-south")
+        self.assertEqual(self.slack.sc.calls, ["channels.info"])
+        self.assertIsNone(self.slack.channel_name("C0NORTH"))
+
+    def test_topic_is_current_without_rtm(self):
+        self.assertEqual(self.slack.channel_topic("C0SOUTH"), "<https://trello.com/b/b1>")
+        self.slack.sc.channels["C0SOUTH"]["topic"] = {"value": "<https://trello.com/b/b2>"}
+        self.assertEqual(self.slack.channel_topic("C0SOUTH"), "<https://trello.com/b/b2>")
+
+    def test_topic_from_rtm(self):
+        self.slack.channels.prime([CHANNEL])
+        self.slack.channels.handle_event({"type": "message", "subtype": "channel_topic", "channel": "C0SOUTH",
+                                          "topic": "<https://trello.com/b/b3>"})
+        self.assertEqual(self.slack.channel_topic("C0SOUTH"), "<https://trello.com/b/b3>")
+        self.assertEqual(self.slack.sc.calls, [])
+
+
+class TestIms(unittest.TestCase):
+
+    def setUp(self):
+        self.slack = Slack("xoxb-token", "UBOT")
+        self.slack.sc = FakeSlackClient()
+
+    def test_classified_by_prefix(self):
+        self.assertFalse(self.slack._is_im("C0SOUTH"))
+        self.assertFalse(self.slack._is_im("G0PRIVATE"))
+        self.assertTrue(self.slack._is_im("D0DM"))
+        self.assertEqual(self.slack.sc.calls, [])
+
+    def test_unknown_prefix_asks_once(self):
+        self.assertTrue(self.slack._is_im("W0DM"))
+        self.assertTrue(self.slack._is_im("W0DM"))
+        self.assertEqual(self.slack.sc.calls, ["im.list"])
+
+    def test_tracked_from_rtm(self):
+        self.slack._track_ims({"type": "im_created", "channel": {"id": "W0NEW"}})
+        self.slack._track_ims({"type": "im_open", "channel": "W0OPEN"})
+        self.assertTrue(self.slack._is_im("W0NEW"))
+        self.assertTrue(self.slack._is_im("W0OPEN"))
+        self.assertEqual(self.slack.sc.calls, [])
+
+
+class TestRtm(unittest.TestCase):
+
+    def test_reads_the_whole_burst(self):
+        slack = Slack("xoxb-token", "UBOT")
+        slack.sc = FakeRtmClient([{"type": "message", "channel": "C0SOUTH", "user": "U{}".format(i),
+                                   "text": "<@UBOT> table {}".format(i), "ts": "1527000000.00000{}".format(i)}
+                                  for i in range(3)])
+        self.addCleanup(slack.sc.close)
+        queue = Queue()
+        with self.assertRaises(ConnectionError):
+            slack._rtm_listen(queue, ping_interval=0.05)
+        self.assertEqual([queue.get_nowait()[0] for _ in range(queue.qsize())], ["table 0", "table 1", "table 2"])
+        self.assertEqual(slack.sc.server.pings, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+
+from dave.data_types import Event, Member
+from dave.state import Database, EventState, EventStore, MemberStore, SyncState
+
+
+class TestSyncState(unittest.TestCase):
+
+    def setUp(self):
+        self.state = SyncState(Database("sqlite:///:memory:"))
+        self.event = Event(id=249792023, name="January Event", time=1527344911000, status="upcoming", rsvp_limit=40,
+                           waitlist_count=10, yes_rsvp_count=40, announced=True,
+                           event_url="https://www.example.com/Stockholm-Roleplaying-Guild/events/249792023/",
+                           venue={"name": "STORG Clubhouse"}, updated=1527000000000)
+
+    def test_unknown_event(self):
+        self.assertIsNone(self.state.get("1"))
+
+    def test_save_and_update(self):
+        self.state.save(EventState(self.event.event_id, 39, 10, 1526000000000, watermark=5))
+        self.state.save(EventState(self.event.event_id, 40, 10, 1527000000000, watermark=6))
+        state = self.state.get(self.event.event_id)
+        self.assertEqual(state.watermark, 6)
+        self.assertTrue(state.unchanged(self.event))
+
+    def test_changed_counters(self):
+        self.state.save(EventState(self.event.event_id, 39, 10, 1527000000000))
+        self.assertFalse(self.state.get(self.event.event_id).unchanged(self.event))
+
+
+class TestEventStore(unittest.TestCase):
+
+    def setUp(self):
+        self.events = EventStore(Database("sqlite:///:memory:"))
+        self.event = Event(id=249792023, name="January Event", time=1527344911000, status="upcoming", rsvp_limit=40,
+                           waitlist_count=10, yes_rsvp_count=40, announced=True,
+                           event_url="https://www.example.com/Stockholm-Roleplaying-Guild/events/249792023/",
+                           venue={"name": "STORG Clubhouse"}, updated=1527000000000)
+
+    def test_round_trip(self):
+        self.assertIsNone(self.events.get("storg"))
+        self.events.put("storg", [self.event])
+        event, = self.events.get("storg", max_age=60)
+        self.assertEqual(event.event_id, self.event.event_id)
+        self.assertEqual(event.venue, self.event.venue)
+
+    def test_too_old(self):
+        self.events.put("storg", [self.event])
+        self.assertIsNone(self.events.get("storg", max_age=-1))
+
+
+class TestMemberStore(unittest.TestCase):
+
+    def setUp(self):
+        self.members = MemberStore(Database("sqlite:///:memory:"))
+
+    def test_keeps_known_ids(self):
+        self.members.save(Member(name="Alex", meetup_id=1234, slack_id="U1234"))
+        self.members.save(Member(name="Alex T", meetup_id=1234))
+        member = self.members.by_slack_id("U1234")
+        self.assertEqual(member.meetup_id, 1234)
+        self.assertEqual(member.name, "Alex T")
+        self.assertIsNone(self.members.by_slack_id("U9999"))
+
+    def test_cards(self):
+        self.assertIsNone(self.members.card_id(1234, "board"))
+        self.members.save_card(1234, "board", "card1")
+        self.members.save_card(1234, "board", "card2")
+        self.assertEqual(self.members.card_id(1234, "board"), "card2")
+        self.members.forget_card(1234, "board")
+        self.assertIsNone(self.members.card_id(1234, "board"))
+
+
+if __name__ == '__main__':
+    unittest.main()
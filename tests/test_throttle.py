@@ -0,0 +1,48 @@
+import unittest
+
+from dave.throttle import SlidingWindow
+
+
+class FakeTime(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestSlidingWindow(unittest.TestCase):
+
+    def setUp(self):
+        self.time = FakeTime()
+        self.window = SlidingWindow(limit=100, window=10, clock=self.time.clock, sleeper=self.time.sleep)
+
+    def test_bursts_up_to_the_limit(self):
+        waits = [self.window.acquire() for _ in range(100)]
+        self.assertEqual(sum(waits), 0)
+        self.assertAlmostEqual(self.window.acquire(), 10)
+
+    def test_never_more_than_the_limit_in_a_window(self):
+        calls = []
+        for _ in range(350):
+            self.window.acquire()
+            calls.append(self.time.now)
+        for n, started in enumerate(calls):
+            self.assertLessEqual(len([t for t in calls[n:] if t < started + 10]), 100)
+        self.assertEqual(self.window.stats["consumed"], 350)
+
+    def test_spread_out_calls_dont_wait(self):
+        for _ in range(300):
+            self.assertAlmostEqual(self.window.acquire(), 0)
+            self.time.now += 0.1
+
+    def test_pause(self):
+        self.window.pause(3)
+        self.assertAlmostEqual(self.window.acquire(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
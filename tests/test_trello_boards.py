@@ -0,0 +1,221 @@
+import copy
+import unittest
+from collections import namedtuple
+
+from trello.exceptions import ResourceUnavailable
+
+from dave.state import Database, MemberStore
+from dave.trello_boards import BoardIndex, BoardSnapshot, TrelloBoard
+
+# Recorded GET /boards/{id} with BoardSnapshot.query_params, trimmed to two tables
+BOARD = {
+    "id": "5b0d4d5c2b8d31f1e7a39a52",
+    "name": "January Event",
+    "url": "https://trello.com/b/Xq8Lr2Aa/january-event",
+    "dateLastActivity": "2018-05-22T10:00:00.000Z",
+    "labels": [
+        {"id": "5b0d4d5c2b8d31f1e7a39a60", "idBoard": "5b0d4d5c2b8d31f1e7a39a52", "name": "GM", "color": "green"},
+        {"id": "5b0d4d5c2b8d31f1e7a39a61", "idBoard": "5b0d4d5c2b8d31f1e7a39a52", "name": "Canceled",
+         "color": "red"},
+        {"id": "5b0d4d5c2b8d31f1e7a39a62", "idBoard": "5b0d4d5c2b8d31f1e7a39a52", "name": "", "color": "blue"},
+    ],
+    "lists": [
+        {"id": "5b0d4d5c2b8d31f1e7a39a72", "name": "1. Rat Queens (Fate)", "closed": False, "pos": 32768},
+        {"id": "5b0d4d5c2b8d31f1e7a39a71", "name": "RSVP", "closed": False, "pos": 16384},
+        {"id": "5b0d4d5c2b8d31f1e7a39a73", "name": "2. Tomb of Horrors (D&D 5e)", "closed": False, "pos": 49152},
+    ],
+    "cards": [
+        {"id": "5b0d4d5c2b8d31f1e7a39a81", "name": "Info", "idList": "5b0d4d5c2b8d31f1e7a39a72", "closed": False,
+         "pos": 16384, "desc": "One more awesome Rat Queens adventure\n\nPlayers: 3", "labels": []},
+        {"id": "5b0d4d5c2b8d31f1e7a39a82", "name": "Jane", "idList": "5b0d4d5c2b8d31f1e7a39a72", "closed": False,
+         "pos": 65536, "desc": "100002", "labels": []},
+        {"id": "5b0d4d5c2b8d31f1e7a39a83", "name": "Doe", "idList": "5b0d4d5c2b8d31f1e7a39a72", "closed": False,
+         "pos": 32768, "desc": "100003",
+         "labels": [{"id": "5b0d4d5c2b8d31f1e7a39a60", "idBoard": "5b0d4d5c2b8d31f1e7a39a52", "name": "GM",
+                     "color": "green"}]},
+        {"id": "5b0d4d5c2b8d31f1e7a39a84", "name": "Dave", "idList": "5b0d4d5c2b8d31f1e7a39a71", "closed": False,
+         "pos": 16384, "desc": "100001", "labels": []},
+        {"id": "5b0d4d5c2b8d31f1e7a39a85", "name": "Info", "idList": "5b0d4d5c2b8d31f1e7a39a73", "closed": False,
+         "pos": 16384, "desc": "Bring a spare character\n\nPlayers: many", "labels": []},
+    ],
+}
+BOARD_ID = BOARD["id"]
+RSVP_LIST = "5b0d4d5c2b8d31f1e7a39a71"
+NotFound = namedtuple("NotFound", "status_code")
+
+
+class FakeTrello(object):
+    def __init__(self, board):
+        self.board = board
+        self.calls = []
+        self.snapshots = 0
+        self._next_id = 0
+
+    def new_id(self):
+        self._next_id += 1
+        return "{:024x}".format(self._next_id)
+
+    def fetch_json(self, uri_path, http_method="GET", query_params=None, post_args=None, **kwargs):
+        self.calls.append((http_method, uri_path))
+        query_params = query_params or {}
+        if uri_path == "/organizations/org/actions":
+            return [] if "since" in query_params else [{"date": "2018-05-22T10:00:00.000Z"}]
+        if uri_path == "/organizations/org/boards":
+            return [{"id": BOARD_ID, "name": self.board["name"], "url": self.board["url"], "closed": False,
+                     "idOrganization": "org"}]
+        if uri_path == "/boards/{}".format(BOARD_ID):
+            if query_params.get("fields") == "dateLastActivity":
+                return {"id": BOARD_ID, "dateLastActivity": self.board["dateLastActivity"]}
+            self.snapshots += 1
+            return copy.deepcopy(self.board)
+        if http_method == "POST" and uri_path == "/lists":
+            board_list = {"id": self.new_id(), "name": post_args["name"], "closed": False, "pos": 65536}
+            self.board["lists"].append(board_list)
+            return dict(board_list)
+        if http_method == "POST" and uri_path == "/cards":
+            card = {"id": self.new_id(), "name": post_args["name"], "desc": post_args["desc"] or "",
+                    "idList": post_args["idList"], "closed": False, "pos": 65536, "labels": []}
+            self.board["cards"].append(card)
+            return dict(card)
+        if http_method == "POST" and uri_path.endswith("/idLabels"):
+            card_id = uri_path.split("/")[2]
+            cards = [c for c in self.board["cards"] if c["id"] == card_id]
+            if not cards:
+                raise ResourceUnavailable("The requested resource was not found.", NotFound(404))
+            card = cards[0]
+            card["labels"].append([l for l in self.board["labels"] if l["id"] == post_args["value"]][0])
+            return [l["id"] for l in card["labels"]]
+        raise AssertionError("Unexpected call {} {}".format(http_method, uri_path))
+
+    def board_fetches(self):
+        """How many times the whole board was fetched"""
+        return self.snapshots
+
+
+def trello_board(client, **kwargs):
+    board = TrelloBoard("key", "token", **kwargs)
+    board.tc = client
+    board._board_index = BoardIndex(client, owner="/organizations/org")
+    return board
+
+
+class TestBoardSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.snapshot = BoardSnapshot(copy.deepcopy(BOARD))
+
+    def test_lists_and_cards_in_board_order(self):
+        self.assertEqual([l["name"] for l in self.snapshot.lists],
+                         ["RSVP", "1. Rat Queens (Fate)", "2. Tomb of Horrors (D&D 5e)"])
+        self.assertEqual([c["name"] for c in self.snapshot.cards("5b0d4d5c2b8d31f1e7a39a72")], ["Info", "Doe", "Jane"])
+        self.assertEqual(self.snapshot.cards("unknown"), [])
+
+    def test_members_and_labels(self):
+        self.assertEqual(self.snapshot.member(100001)["name"], "Dave")
+        self.assertIsNone(self.snapshot.member(100009))
+        self.assertEqual(sorted(self.snapshot.participants), [100001, 100002, 100003])
+        self.assertEqual(self.snapshot.label("Canceled")["color"], "red")
+        self.assertIsNone(self.snapshot.label(""))
+
+    def test_closed_cards_and_lists_are_left_out(self):
+        board = copy.deepcopy(BOARD)
+        board["lists"][2]["closed"] = True
+        board["cards"][1]["closed"] = True
+        snapshot = BoardSnapshot(board)
+        self.assertEqual(len(snapshot.lists), 2)
+        self.assertIsNone(snapshot.member(100002))
+
+
+class TestTrelloBoard(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeTrello(copy.deepcopy(BOARD))
+        self.trello = trello_board(self.client)
+
+    def test_tables_for_event(self):
+        tables = self.trello.tables_for_event("January Event")
+        self.assertEqual(list(tables), [1, 2, 9999])
+        self.assertEqual(tables[1].title, "Rat Queens (Fate)")
+        self.assertEqual(tables[1].gm, "Doe")
+        self.assertEqual(tables[1].players, ["Jane"])
+        self.assertEqual(tables[1].blurb, "One more awesome Rat Queens adventure\n\n")
+        self.assertEqual(tables[1].max_players, 3)
+        self.assertEqual(tables[9999].players, ["Dave"])
+        self.assertEqual(self.trello.table("January Event", 2).title, "Tomb of Horrors (D&D 5e)")
+
+    def test_reads_share_one_fetch(self):
+        self.trello.tables_for_event("January Event")
+        self.assertEqual(sorted(self.trello.participants("January Event")), [100001, 100002, 100003])
+        self.assertEqual(self.client.board_fetches(), 1)
+
+    def test_add_table(self):
+        answer = self.trello.add_table("Masks (PbtA)", "Teen superheroes. Players: 4", BOARD["url"])
+        self.assertEqual(answer, "Table *3. Masks (PbtA)* added to *January Event*")
+        table = self.trello.table("January Event", 3)
+        self.assertEqual(table.title, "Masks (PbtA)")
+        self.assertEqual(table.max_players, 4)
+        self.assertEqual(self.client.board_fetches(), 1)
+
+    def test_new_rsvps_go_to_the_rsvp_list(self):
+        self.client.board["lists"][1]["pos"] = 99999
+        self.trello.add_rsvp("John", 100004, "January Event")
+        self.assertEqual(self.client.board["cards"][-1]["idList"], RSVP_LIST)
+
+    def test_writes_update_the_cached_snapshot(self):
+        self.trello.participants("January Event")
+        self.trello.add_rsvp("John", 100004, "January Event")
+        self.trello.add_rsvp("Alex", 100005, "January Event")
+        self.trello.cancel_rsvp(100002, "January Event")
+        self.assertEqual(self.trello.table("January Event", 9999).players, ["Dave", "John", "Alex"])
+        self.assertEqual(self.trello.table("January Event", 1).players, [])
+        self.assertEqual(self.client.board_fetches(), 1)
+        self.assertIn(100005, self.trello.participants("January Event"))
+        self.assertEqual(self.trello.canceled("January Event"), [100002])
+
+
+class TestMemberCards(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeTrello(copy.deepcopy(BOARD))
+        self.members = MemberStore(Database("sqlite:///:memory:"))
+        self.trello = trello_board(self.client, member_store=self.members)
+
+    def test_remembers_the_card(self):
+        self.trello.add_rsvp("John", 100004, "January Event")
+        card_id = self.members.card_id(100004, BOARD_ID)
+        self.assertEqual(self.client.board["cards"][-1]["id"], card_id)
+        self.trello.add_rsvp("John", 100004, "January Event")
+        self.assertEqual(len([c for c in self.client.board["cards"] if c["desc"] == "100004"]), 1)
+
+    def test_adds_back_a_deleted_card(self):
+        self.trello.add_rsvp("John", 100004, "January Event")
+        deleted = self.members.card_id(100004, BOARD_ID)
+        self.client.board["cards"] = [c for c in self.client.board["cards"] if c["id"] != deleted]
+        self.trello.invalidate(BOARD_ID)
+        self.trello.add_rsvp("John", 100004, "January Event")
+        self.assertIn(100004, self.trello.participants("January Event"))
+        self.assertNotEqual(self.members.card_id(100004, BOARD_ID), deleted)
+
+    def test_cancels_the_card_on_the_board(self):
+        self.trello.add_rsvp("John", 100004, "January Event")
+        archived = self.members.card_id(100004, BOARD_ID)
+        self.client.board["cards"][-1]["closed"] = True
+        self.client.board["cards"].append({"id": "5b0d4d5c2b8d31f1e7a39a86", "name": "John", "idList": RSVP_LIST,
+                                           "closed": False, "pos": 32768, "desc": "100004", "labels": []})
+        self.trello.invalidate(BOARD_ID)
+        self.trello.cancel_rsvp(100004, "January Event")
+        self.assertEqual(self.client.board["cards"][-1]["labels"][0]["name"], "Canceled")
+        self.assertNotEqual(self.members.card_id(100004, BOARD_ID), archived)
+        self.assertEqual(self.trello.canceled("January Event"), [100004])
+
+    def test_skips_a_card_deleted_meanwhile(self):
+        self.trello.add_rsvp("John", 100004, "January Event")
+        self.client.board["cards"].pop()
+        self.trello.cancel_rsvp(100004, "January Event")
+        self.assertIsNone(self.members.card_id(100004, BOARD_ID))
+        self.assertEqual(self.trello.canceled("January Event"), [])
+        self.assertEqual(self.client.board_fetches(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
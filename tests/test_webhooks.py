@@ -0,0 +1,83 @@
+import json
+import unittest
+from threading import Thread
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from dave.state import Database, SnapshotStore
+from dave.trello_boards import BoardSnapshot
+from dave.webhooks import WebhookReceiver, signature
+
+CALLBACK_URL = "https://dave.example.com/trello"
+SECRET = "secret"
+
+BOARD = {
+    "id": "b1", "name": "January Event", "url": "https://trello.com/b/b1", "dateLastActivity": "2018-01-01T10:00:00.000Z",
+    "lists": [{"id": "l1", "name": "RSVP", "pos": 1}, {"id": "l2", "name": "1. Awesome Game", "pos": 2}],
+    "labels": [{"id": "gm", "name": "GM"}, {"id": "canceled", "name": "Canceled"}],
+    "cards": [{"id": "c1", "name": "Dave", "desc": "100001", "idList": "l1", "labels": [], "pos": 1}],
+}
+
+
+class FakeTrello(object):
+    def __init__(self, objects):
+        """Answers GET /cards/{id} and GET /lists/{id} from :objects:, by id"""
+        self.objects = objects
+
+    def fetch_json(self, path, query_params=None):
+        return dict(self.objects[path.rsplit("/", 1)[-1]])
+
+
+def payload(action_type, date, **data):
+    data["board"] = {"id": "b1"}
+    return {"model": {"id": "b1"}, "action": {"type": action_type, "date": date, "data": data}}
+
+
+class TestWebhookReceiver(unittest.TestCase):
+
+    def setUp(self):
+        self.store = SnapshotStore(Database("sqlite:///:memory:"))
+        self.store.put("b1", json.loads(json.dumps(BOARD)))
+        client = FakeTrello({"c2": {"name": "Jane", "desc": "100002", "idList": "l1", "labels": [], "pos": 2},
+                             "l3": {"name": "2. Other Game", "pos": 3, "closed": False}})
+        self.receiver = WebhookReceiver(client, self.store, SECRET, CALLBACK_URL)
+        self.server = self.receiver.serve(host="127.0.0.1", port=0)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def post(self, recorded, sign=True):
+        body = json.dumps(recorded).encode()
+        headers = {"X-Trello-Webhook": signature(body, CALLBACK_URL, SECRET) if sign else "forged"}
+        url = "http://127.0.0.1:{}/".format(self.server.server_address[1])
+        try:
+            return urlopen(Request(url, data=body, headers=headers)).status
+        except HTTPError as e:
+            return e.code
+
+    def test_bad_signature(self):
+        self.assertEqual(self.post(payload("deleteCard", "2018-01-02T10:00:00.000Z", card={"id": "c1"}),
+                                   sign=False), 401)
+        self.assertEqual(len(self.store.get("b1")["cards"]), 1)
+
+    def test_create_and_move_card(self):
+        self.assertEqual(self.post(payload("createCard", "2018-01-02T10:00:00.000Z", card={"id": "c2"},
+                                           list={"id": "l1"})), 200)
+        self.post(payload("updateCard", "2018-01-02T11:00:00.000Z", card={"id": "c2", "idList": "l2"}))
+        board = self.store.get("b1")
+        self.assertEqual([(c["desc"], c["idList"]) for c in board["cards"]], [("100001", "l1"), ("100002", "l2")])
+        self.assertEqual(board["dateLastActivity"], "2018-01-02T11:00:00.000Z")
+
+    def test_labels_and_lists(self):
+        self.post(payload("addLabelToCard", "2018-01-02T10:00:00.000Z", card={"id": "c1"},
+                          label={"id": "canceled", "name": "Canceled"}))
+        self.post(payload("createList", "2018-01-02T10:00:00.000Z", list={"id": "l3", "name": "2. Other Game"}))
+        board = self.store.get("b1")
+        self.assertEqual(board["cards"][0]["labels"][0]["name"], "Canceled")
+        self.assertEqual([l["name"] for l in BoardSnapshot(board).lists], ["RSVP", "1. Awesome Game", "2. Other Game"])
+
+
+if __name__ == '__main__':
+    unittest.main()
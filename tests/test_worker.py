@@ -0,0 +1,93 @@
+import asyncio
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+
+from dave.scheduler import SyncScheduler
+from worker import ShardedQueue, monitor, read_in_thread
+
+
+class Stop(BaseException):
+    pass
+
+
+class FakeBot(object):
+    def __init__(self, *syncs):
+        """Each call to sync returns or raises the next of :syncs:"""
+        self.syncs = list(syncs)
+        self.scheduler = SyncScheduler(min_interval=0)
+        self.read = None
+
+    def sync(self):
+        result = self.syncs.pop(0)
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    def read_chat(self, tasks):
+        if self.read:
+            raise self.read
+
+
+class UncountableQueue(Queue):
+    """Like a multiprocessing queue on macOS"""
+
+    def qsize(self):
+        raise NotImplementedError
+
+
+class TestShardedQueue(unittest.TestCase):
+
+    def test_same_channel_same_worker_in_order(self):
+        queues = [Queue() for _ in range(3)]
+        tasks = ShardedQueue(queues)
+        for n in range(10):
+            for channel in ("C0SOUTH", "C0NORTH", "D0DM"):
+                tasks.put(("table {}".format(n), channel, "U1", "1527000000.00000{}".format(n)))
+        for queue in queues:
+            by_channel = {}
+            while not queue.empty():
+                command, channel, _, _ = queue.get_nowait()
+                by_channel.setdefault(channel, []).append(command)
+            for commands in by_channel.values():
+                self.assertEqual(commands, ["table {}".format(n) for n in range(10)])
+        self.assertEqual(sum(len(q.queue) for q in queues), 0)
+        self.assertEqual(tasks.depths(), [0, 0, 0])
+
+    def test_depths(self):
+        tasks = ShardedQueue([Queue(), Queue()])
+        tasks.put(("help", "C0SOUTH", "U1", "1"))
+        self.assertEqual(sum(tasks.depths()), 1)
+
+    def test_depths_unknown(self):
+        tasks = ShardedQueue([UncountableQueue()])
+        tasks.put(("help", "C0SOUTH", "U1", "1"))
+        self.assertEqual(tasks.depths(), [])
+
+
+
+class TestRunAsyncio(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.pool = ThreadPoolExecutor(max_workers=1)
+
+    def tearDown(self):
+        self.pool.shutdown()
+        self.loop.close()
+
+    def test_monitor_keeps_going_after_a_failed_sync(self):
+        bot = FakeBot(RuntimeError("Trello is down"), 0, Stop())
+        with self.assertRaises(Stop):
+            self.loop.run_until_complete(monitor(self.loop, self.pool, bot))
+        self.assertEqual(bot.syncs, [])
+
+    def test_reader_crash_is_reported(self):
+        bot = FakeBot()
+        bot.read = ConnectionError("RTM connection lost")
+        with self.assertRaises(ConnectionError):
+            self.loop.run_until_complete(read_in_thread(self.loop, bot, Queue()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+"""
+Receives Trello webhooks for the team's open boards, so the bot can read them without polling Trello.
+Optional: the bot falls back to polling when this isn't running.
+"""
+
+from os import environ
+from threading import Thread
+from time import sleep
+
+from dave.log import logger
+from dave.state import Database, SnapshotStore
+from dave.trello_boards import TrelloBoard
+from dave.webhooks import WebhookReceiver
+
+
+def keep_registered(receiver, trello, check_every):
+    while True:
+        try:
+            receiver.register(trello.boards)
+        except Exception as e:
+            logger.error("Swallowed exception while registering webhooks: {}".format(e))
+        sleep(check_every)
+
+
+if __name__ == "__main__":
+    # A tenth of Trello's rate limits. The worker keeps the rest, see TRELLO_TOKEN_RATE in dave/bot.py
+    trello = TrelloBoard(api_key=environ["TRELLO_API_KEY"], token=environ["TRELLO_TOKEN"],
+                         team_name=environ["TRELLO_TEAM"], token_rate=1.0, key_rate=3.0)
+    receiver = WebhookReceiver(trello.tc, SnapshotStore(Database()), secret=environ["TRELLO_API_SECRET"],
+                               callback_url=environ["WEBHOOK_CALLBACK_URL"])
+    server = receiver.serve(port=int(environ.get("PORT", "8000")))
+    # Trello checks the callback URL answers before it creates a webhook, so serve first
+    Thread(target=server.serve_forever, daemon=True).start()
+    keep_registered(receiver, trello, int(environ.get("WEBHOOK_CHECK_TIME", "600")))
@@ -1,31 +1,167 @@
 #!/usr/bin/env python
 
+import asyncio
 import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+from threading import Thread
+from zlib import crc32
 
+from dave import metrics
 from dave.bot import Bot
+from dave.log import logger
+
+QUEUE_DEPTH = metrics.REGISTRY.gauge("dave_queue_depth", "Chat commands waiting for a conversation worker")
 
 
 class Worker(mp.Process):
-    def __init__(self, task_queue, result_queue, bot):
+    def __init__(self, task_queue, result_queue, bot, metrics_port_offset=0, trello_share=1):
         mp.Process.__init__(self)
         self.task_queue = task_queue
         self.result_queue = result_queue
         self.bot = bot
+        self.metrics_port_offset = metrics_port_offset
+        self.trello_share = trello_share
 
     def run(self):
+        metrics.start(self.metrics_port_offset)
+        self.bot.trello.tc.share(self.trello_share)
         self.bot.conversation(self.task_queue)
 
 
-if __name__ == "__main__":
-    dave = Bot()
+class ShardedQueue(object):
+    def __init__(self, queues):
+        """Spreads tasks over :queues: by channel id, so that each channel is always served by the same worker
+        and gets its answers in the order it asked
+
+        :param queues: (list) One queue per worker
+        """
+        self.queues = queues
+        metrics.REGISTRY.add_collector(self._collect_depths)
+
+    def put(self, task):
+        channel_id = task[1]
+        shard = crc32(channel_id.encode()) % len(self.queues)
+        self.queues[shard].put(task)
+        logger.debug("Queued command for {} on worker {}, {} waiting".format(channel_id, shard, self.depths()))
+
+    def depths(self):
+        try:
+            return [q.qsize() for q in self.queues]
+        except NotImplementedError:
+            return []
+
+    def _collect_depths(self):
+        for shard, depth in enumerate(self.depths()):
+            QUEUE_DEPTH.set(depth, shard=shard)
+
+
+class LoopQueue(object):
+    def __init__(self, loop):
+        """An asyncio queue that threads can put tasks in, e.g. the Slack RTM reader
+
+        :param loop: (AbstractEventLoop) The loop the tasks are consumed in
+        """
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def put(self, task):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, task)
+
+    def qsize(self):
+        return self.queue.qsize()
+
+
+async def converse(loop, pool, bot, queue):
+    while True:
+        task = await queue.queue.get()
+        await loop.run_in_executor(pool, bot.answer, task, queue)
+
+
+async def monitor(loop, pool, bot):
+    while True:
+        try:
+            sleep_for = await loop.run_in_executor(pool, bot.sync)
+        except Exception as e:
+            # Bot.sync has reported it already. Keep the chat going and try again later
+            sleep_for = bot.scheduler.min_interval
+            logger.warning("Sync failed ({}), trying again in {}s".format(e, sleep_for))
+        await asyncio.sleep(sleep_for)
+
 
-    tasks = mp.JoinableQueue()
-    results = mp.Queue()
+def read_in_thread(loop, bot, tasks):
+    """Reads the chat on a daemon thread, which blocks on Slack's RTM socket, so that it doesn't keep
+    the process alive once the loop is done
 
-    worker = Worker(tasks, results, dave)
-    reader = mp.Process(target=dave.read_chat, args=(tasks,))
-    monitor = mp.Process(target=dave.monitor_events)
+    :return: (Future) Done when the reader stops, with its exception if it crashed
+    """
+    done = loop.create_future()
 
-    worker.start()
+    def read():
+        try:
+            bot.read_chat(tasks)
+        except BaseException as e:
+            loop.call_soon_threadsafe(done.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(done.set_result, None)
+
+    Thread(target=read, name="rtm-reader", daemon=True).start()
+    return done
+
+
+def with_metrics(port_offset, target, *args):
+    metrics.start(port_offset)
+    target(*args)
+
+
+def run_monitor(bot, trello_share):
+    bot.trello.tc.share(trello_share)
+    with_metrics(0, bot.monitor_events)
+
+
+def run_processes(bot, worker_count):
+    """Reads the chat, answers it and syncs the events in separate processes, each with its own copy of :bot:.
+    Each process serves its own metrics: the monitor on $METRICS_PORT, the reader on the next port
+    and the conversation workers on the ones after that.
+    The processes share the Trello rate limits. The monitor writes the most, so it gets half of them
+    and the conversation workers split the other half. The reader doesn't call Trello.
+    """
+    queues = [mp.JoinableQueue() for _ in range(worker_count)]
+    tasks = ShardedQueue(queues)
+
+    workers = [Worker(queue, mp.Queue(), bot, metrics_port_offset=2 + n, trello_share=0.5 / worker_count)
+               for n, queue in enumerate(queues)]
+    reader = mp.Process(target=with_metrics, args=(1, bot.read_chat, tasks))
+    monitor_process = mp.Process(target=run_monitor, args=(bot, 0.5))
+
+    for worker in workers:
+        worker.start()
     reader.start()
-    monitor.start()
+    monitor_process.start()
+
+
+def run_asyncio(bot, worker_count):
+    """Reads the chat, answers it and syncs the events as tasks of one event loop, sharing :bot:,
+    its caches and its connection pools. The Slack, Meetup and Trello clients block, so their calls
+    run on a thread pool. The process exits if the reader or a conversation crashes.
+    """
+    metrics.start()
+    loop = asyncio.get_event_loop()
+    # One thread per conversation and one for the sync
+    pool = ThreadPoolExecutor(max_workers=worker_count + 1)
+    loop.set_default_executor(pool)
+
+    queues = [LoopQueue(loop) for _ in range(worker_count)]
+    reader = read_in_thread(loop, bot, ShardedQueue(queues))
+    conversations = [converse(loop, pool, bot, queue) for queue in queues]
+    loop.run_until_complete(asyncio.gather(reader, monitor(loop, pool, bot), *conversations))
+
+
+if __name__ == "__main__":
+    dave = Bot()
+    worker_count = int(environ.get("CONVERSATION_WORKERS", "3"))
+
+    if environ.get("DAVE_RUNTIME", "processes") == "asyncio":
+        run_asyncio(dave, worker_count)
+    else:
+        run_processes(dave, worker_count)